@@ -0,0 +1,118 @@
+"""
+Cost-Aware Admission Control
+
+A 4K screenshot costs many times the CPU of a 600px crop, so counting
+requests says little about load. The AdmissionController prices each image
+by its pixel count, read from the header before anything is decoded, and:
+1. Charges that cost to a per-client token bucket (pixels per second with a
+   burst allowance), so a client sending large images runs out of budget
+   sooner than one sending small crops
+2. Caps the total pixel cost of images being processed at once in this
+   worker. Small images still fit under the cap while a large one is
+   running, so large images cannot crowd them out
+
+Rejections carry a Retry-After estimate. State is per worker process, like
+the rest of the server's in-memory state.
+"""
+
+import math
+import time
+from collections import OrderedDict
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is over its client's budget or the worker's in-flight cap.
+
+    Attributes:
+        reason: 'rate' (client's token bucket is empty) or 'capacity' (in-flight cap reached)
+        retry_after: Suggested seconds before retrying
+    """
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Admission rejected ({reason}); retry after {retry_after} s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Per-client pixel token buckets plus a per-worker in-flight pixel budget.
+
+    Not thread-safe: call it from the event loop only.
+
+    Args:
+        rate_pixels: Pixels per second added to each client's bucket; 0 disables the buckets
+        burst_pixels: Bucket capacity, i.e. the most a client can spend at once
+        max_in_flight_pixels: Cap on the cost of admitted, unfinished requests; 0 disables it
+        base_cost: Fixed cost added to every image (inference and per-request overhead)
+        max_clients: Client buckets kept; the least recently seen are forgotten (refilled)
+        retry_after: Retry-After for capacity rejections
+    """
+
+    def __init__(self, rate_pixels: float, burst_pixels: float, max_in_flight_pixels: float,
+                 base_cost: int = 0, max_clients: int = 10000, retry_after: int = 1):
+        self.rate = rate_pixels
+        self.burst = max(burst_pixels, 1.0)
+        self.max_in_flight = max_in_flight_pixels
+        self.base_cost = base_cost
+        self.max_clients = max_clients
+        self.retry_after = retry_after
+        self.in_flight = 0.0
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()  # client -> (tokens, updated)
+        self.rejected = {'rate': 0, 'capacity': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 or self.max_in_flight > 0
+
+    def cost(self, width: int, height: int) -> float:
+        """Estimated cost of an image from its header dimensions."""
+        return self.base_cost + width * height
+
+    def _tokens(self, client: str, now: float) -> float:
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def acquire(self, client: str | None, cost: float) -> float:
+        """Admit a request of the given cost, or raise AdmissionRejected.
+
+        A client of None is held to the in-flight cap only, for traffic
+        with a budget of its own (e.g. an endpoint with its own rate limit).
+
+        A cost above the burst size is charged as the burst size, so any
+        image within the server's pixel limit can be admitted from a full
+        bucket. Likewise a request larger than the in-flight cap is admitted
+        when nothing else is running.
+
+        Returns:
+            The charged cost, to pass to release() when the request finishes
+        """
+        if self.max_in_flight > 0 and self.in_flight > 0 and self.in_flight + cost > self.max_in_flight:
+            self.rejected['capacity'] += 1
+            raise AdmissionRejected('capacity', self.retry_after)
+
+        if self.rate > 0 and client is not None:
+            now = time.monotonic()
+            tokens = self._tokens(client, now)
+            charge = min(cost, self.burst)
+            if tokens < charge:
+                self._buckets[client] = (tokens, now)
+                self.rejected['rate'] += 1
+                raise AdmissionRejected('rate', max(1, math.ceil((charge - tokens) / self.rate)))
+            self._buckets[client] = (tokens - charge, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+
+        self.in_flight += cost
+        return cost
+
+    def release(self, cost: float) -> None:
+        """Return an admitted request's cost to the in-flight budget."""
+        self.in_flight = max(0.0, self.in_flight - cost)
+
+    def stats(self) -> dict:
+        return {
+            'in_flight_pixels': int(self.in_flight),
+            'max_in_flight_pixels': int(self.max_in_flight),
+            'clients': len(self._buckets),
+            'rejected': dict(self.rejected),
+        }
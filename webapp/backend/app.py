@@ -3,37 +3,180 @@ FastAPI Backend for Chess FEN Generator
 
 Endpoints:
 - POST /predict: Receives image, returns FEN and analysis links
-- GET /health: Health check endpoint
+- POST /predict-base64: Same as /predict for a base64-encoded image
+- POST /predict/raw: Same as /predict for an image sent as the raw request body
+- POST /predict/batch: Many images or an archive, results streamed as NDJSON
+- POST /predict/pipeline: Visualizations of each board detection step
+- POST /jobs: Spool images or archives for background processing, returns a job id
+- GET /jobs/{job_id}: Progress and results of a background job
+- WS /ws/live: Stream of frames in, FEN out whenever the position changes
+- GET /health: Liveness check (answers as soon as the server is up)
+- GET /ready: Readiness check (200 only once the model is loaded and warmed up)
+- GET /cache/stats: Result cache, board cache, request coalescing and cascade counters
+- GET /metrics: Prometheus metrics
+
+Run with `python serve.py` for the pre-fork multi-worker mode.
+
+CPU-bound work (decode, detection, encoding) runs on a bounded thread pool so
+the event loop keeps serving other connections; when its queue is full the
+server answers 503 with a Retry-After header. /predict/pipeline runs in a
+separate low-priority lane and is shed first under load.
 """
 
+import asyncio
 import base64
-import io
 import logging
 import os
+import shutil
+import tempfile
+import time
 from contextlib import asynccontextmanager
+from typing import BinaryIO
 
+_imports_started = time.perf_counter()
+
+import cv2
 import numpy as np
-from fastapi import FastAPI, File, Query, Request, UploadFile, HTTPException
+from fastapi import Depends, FastAPI, File, Query, Request, UploadFile, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from PIL import Image
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
 
+from admission import AdmissionController, AdmissionRejected
+from archives import ZIP_MAGIC, ArchiveError, ArchiveMemberTooLarge, is_archive, iter_archive
+from batching import MicroBatcher
+import metrics
+from image_io import ImageTooLarge, decode_image, probe_size
+from jobs import JobClaim, JobSpool, SpoolFull
+from live import LiveBoardTracker
+from upload_limits import BodySizeLimitMiddleware, read_upload_limited
+from cache import BoardSignatureIndex, ResultCache, SingleFlight, board_signature, content_key, file_digest
+from workers import BoundedExecutor, ExecutorBusy
 from board_detection import detect_board, detect_board_with_intermediates, draw_bbox_on_image
-from fen_generator import load_model, predict_fen
+from empty_squares import empty_square_mask, merge_predictions
+from fen_generator import (
+    TILES_PER_BOARD, CascadeRunner, InferenceRunner, batch_buckets, load_model, model_file,
+    predictions_to_fen, process_board_for_model,
+)
 from pipeline_viz import (
     viz_rough_crop, viz_equalized, viz_gradients,
     viz_projections, viz_grid_lines,
 )
+from warmup import warmup
+
+# Cold-start phases in seconds: imports, model_load, compile, warmup (serve.py fills
+# in imports, which it does once before forking the workers)
+cold_start: dict[str, float] = {'imports': time.perf_counter() - _imports_started}
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 logger = logging.getLogger(__name__)
 
 # --- Constants ---
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+MULTIPART_OVERHEAD = 64 * 1024  # allowance for multipart boundaries and headers around the file
+BATCH_MAX_UPLOAD_SIZE = int(float(os.environ.get("BATCH_MAX_UPLOAD_MB", "200")) * 1024 * 1024)
+# Largest decoded image accepted, checked from the header before decoding
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", str(40_000_000)))
+# Decoder: 'cv2' or 'pil'. Images whose longer side is at least twice DECODE_MAX_SIDE
+# are decoded at 1/2, 1/4 or 1/8 scale, never below DECODE_MAX_SIDE (0 disables)
+DECODE_BACKEND = os.environ.get("DECODE_BACKEND", "cv2")
+DECODE_MAX_SIDE = int(os.environ.get("DECODE_MAX_SIDE", "2048"))
+
+# Rate limit of /predict/raw, meant for internal services (one client IP, many requests)
+RAW_RATE_LIMIT = os.environ.get("RAW_RATE_LIMIT", "60/minute")
+
+# Inference backend: 'keras' (TensorFlow) or 'onnx' (ONNX Runtime on CPU; TensorFlow is
+# never imported). MODEL_PATH overrides the backend's default model file.
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "keras")
+MODEL_PATH = os.environ.get("MODEL_PATH") or None
+# Which model produces results, as part of result cache keys: the shared disk cache must
+# never return a result computed by a different backend or model file
+MODEL_IDENTITY = f"{MODEL_BACKEND}:{MODEL_PATH or 'default'}"
+# (intra-op, inter-op) threads for ONNX Runtime; 0 = runtime default. serve.py replaces
+# them with its per-worker defaults (TensorFlow's are set through configure_threads())
+INFERENCE_THREADS = (int(os.environ.get("TF_INTRA_OP_THREADS", "0")),
+                     int(os.environ.get("TF_INTER_OP_THREADS", "0")))
+
+# Cascade inference (keras backend): tiles whose top-class probability from the first
+# fold is below this threshold are escalated to the remaining folds; 0 runs the full
+# ensemble on every tile
+CASCADE_THRESHOLD = float(os.environ.get("CASCADE_THRESHOLD", "0"))
+
+# Empty-square fast path: tiles that are flat patches of the board's square colours are
+# classified as empty without the model (see empty_squares.py). Off unless EMPTY_SKIP=1;
+# measure the false-skip rate with benchmarks/bench_empty_squares.py before enabling
+EMPTY_SKIP = os.environ.get("EMPTY_SKIP", "0") == "1"
+EMPTY_SKIP_MAX_STD = float(os.environ.get("EMPTY_SKIP_MAX_STD", "0.02"))    # grey-level std, [0, 1] scale
+EMPTY_SKIP_MAX_EDGE = float(os.environ.get("EMPTY_SKIP_MAX_EDGE", "0.01"))  # mean absolute gradient
+EMPTY_SKIP_MAX_COLOR = float(os.environ.get("EMPTY_SKIP_MAX_COLOR", "0.06"))  # distance to square colour
+
+# Full inference configuration in result cache keys: model identity plus the decode,
+# cascade and fast-path settings, which can also change a result. The weights' content
+# hash (model_digest) is added once the model is loaded
+MODEL_CACHE_KEY = ":".join((
+    MODEL_IDENTITY,
+    f"{DECODE_BACKEND},{DECODE_MAX_SIDE}",
+    f"{CASCADE_THRESHOLD:g}",
+    f"{EMPTY_SKIP_MAX_STD:g},{EMPTY_SKIP_MAX_EDGE:g},{EMPTY_SKIP_MAX_COLOR:g}" if EMPTY_SKIP else "off",
+))
+
+# Micro-batching: boards from concurrent requests share one model call
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "8"))          # boards per model call
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "5"))  # max wait for a batch to fill
+
+# CPU executor: detection, preprocessing and encoding run off the event loop
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+CPU_QUEUE_DEPTH = int(os.environ.get("CPU_QUEUE_DEPTH", "16"))  # tasks allowed to wait for a worker
+RETRY_AFTER_SECONDS = int(os.environ.get("RETRY_AFTER_SECONDS", "2"))
+
+# Visualization lane: /predict/pipeline runs on its own low-priority executor so it
+# cannot take threads or queue slots from the interactive FEN endpoints
+VIZ_WORKERS = int(os.environ.get("VIZ_WORKERS", "1"))
+VIZ_QUEUE_DEPTH = int(os.environ.get("VIZ_QUEUE_DEPTH", "2"))
+VIZ_NICE = int(os.environ.get("VIZ_NICE", "10"))  # niceness added to visualization threads (Linux)
+VIZ_SHED_QUEUE = int(os.environ.get("VIZ_SHED_QUEUE", "1"))  # shed visualizations once this many CPU tasks wait
+
+# Cost-aware admission: images are priced by header pixel count (plus a fixed base cost),
+# charged to a per-client token bucket and capped in flight per worker (0 disables each)
+ADMISSION_RATE_MPX = float(os.environ.get("ADMISSION_RATE_MPX", "1.0"))  # megapixels/second per client
+ADMISSION_BURST_MPX = float(os.environ.get("ADMISSION_BURST_MPX", "40"))  # bucket size per client
+ADMISSION_IN_FLIGHT_MPX = float(os.environ.get("ADMISSION_IN_FLIGHT_MPX", "48"))  # per worker
+ADMISSION_BASE_PIXELS = int(os.environ.get("ADMISSION_BASE_PIXELS", "250000"))  # fixed cost per image
+
+# /predict/batch limits
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "100"))  # images per batch request
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", str(CPU_WORKERS)))  # images in flight per batch
+
+# Background jobs (/jobs): uploads are spooled to disk and processed by the workers
+JOB_SPOOL_DIR = os.environ.get("JOB_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "fen-jobs"))
+JOB_SPOOL_MAX_MB = float(os.environ.get("JOB_SPOOL_MAX_MB", "2048"))  # new jobs refused above this
+JOB_MAX_UPLOAD_SIZE = int(float(os.environ.get("JOB_MAX_UPLOAD_MB", "500")) * 1024 * 1024)
+JOB_MAX_ITEMS = int(os.environ.get("JOB_MAX_ITEMS", "5000"))  # images per job
+JOB_TTL_HOURS = float(os.environ.get("JOB_TTL_HOURS", "24"))  # finished jobs kept this long
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "1.0"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))  # claims without progress before a job fails
+
+# Result cache keyed by upload hash + parameters (memory LRU + optional shared disk tier)
+RESULT_CACHE_MAX_MB = float(os.environ.get("RESULT_CACHE_MAX_MB", "64"))  # 0 disables the memory tier
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get("RESULT_CACHE_TTL_SECONDS", "3600"))
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "")  # empty disables the disk tier
+RESULT_CACHE_DISK_MAX_MB = float(os.environ.get("RESULT_CACHE_DISK_MAX_MB", "512"))
+
+# Annotated image defaults (overridable per request)
+ANNOTATE_FORMAT = os.environ.get("ANNOTATE_FORMAT", "jpeg")  # none | png | jpeg | webp
+ANNOTATE_MAX_WIDTH = int(os.environ.get("ANNOTATE_MAX_WIDTH", "1024"))
+ANNOTATE_QUALITY = int(os.environ.get("ANNOTATE_QUALITY", "80"))  # JPEG/WEBP quality
+
+# Live stream (/ws/live): change detection between frames
+LIVE_TILE_THRESHOLD = float(os.environ.get("LIVE_TILE_THRESHOLD", "6.0"))  # grey levels per square
+LIVE_MAX_CHANGED_TILES = int(os.environ.get("LIVE_MAX_CHANGED_TILES", "16"))  # above this, re-detect the board
+
+# Near-duplicate board cache: reuse the classification of a perceptually identical board crop
+BOARD_CACHE_SIZE = int(os.environ.get("BOARD_CACHE_SIZE", "1024"))  # boards remembered; 0 disables
+BOARD_CACHE_THRESHOLD = float(os.environ.get("BOARD_CACHE_THRESHOLD", "3.0"))  # max mean grey-level diff per square
 
 # Magic byte signatures for allowed image formats
 MAGIC_SIGNATURES = [
@@ -56,18 +199,314 @@ def _is_allowed_image(data: bytes) -> bool:
 
 # Global model instance
 model = None
+runner: InferenceRunner | CascadeRunner | None = None  # compiled fixed-size inference graphs of model
+ready = False  # set once the model is loaded and warmed up
+model_digest = ""  # SHA-256 of the model file, part of result cache keys (set before ready)
+batcher: MicroBatcher | None = None
+cpu_executor = BoundedExecutor("cpu", CPU_WORKERS, CPU_QUEUE_DEPTH, retry_after=RETRY_AFTER_SECONDS,
+                               on_change=lambda in_flight, queued: metrics.QUEUE_DEPTH.labels("cpu").set(queued))
+viz_executor = BoundedExecutor("viz", VIZ_WORKERS, VIZ_QUEUE_DEPTH, retry_after=RETRY_AFTER_SECONDS,
+                               on_change=lambda in_flight, queued: metrics.QUEUE_DEPTH.labels("viz").set(queued),
+                               nice=VIZ_NICE)
+result_cache = ResultCache(
+    max_bytes=int(RESULT_CACHE_MAX_MB * 1024 * 1024),
+    ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+    disk_dir=RESULT_CACHE_DIR or None,
+    disk_max_bytes=int(RESULT_CACHE_DISK_MAX_MB * 1024 * 1024),
+)
+board_index = BoardSignatureIndex(BOARD_CACHE_SIZE, BOARD_CACHE_THRESHOLD)
+inflight = SingleFlight()  # coalesces identical concurrent /predict requests
+job_spool = JobSpool(JOB_SPOOL_DIR, int(JOB_SPOOL_MAX_MB * 1024 * 1024), JOB_TTL_HOURS * 3600, JOB_MAX_ATTEMPTS)
+admission = AdmissionController(
+    rate_pixels=ADMISSION_RATE_MPX * 1_000_000,
+    burst_pixels=ADMISSION_BURST_MPX * 1_000_000,
+    max_in_flight_pixels=ADMISSION_IN_FLIGHT_MPX * 1_000_000,
+    base_cost=ADMISSION_BASE_PIXELS,
+    retry_after=RETRY_AFTER_SECONDS,
+)
+
+
+def load_configured_model():
+    """Load the model with the configured backend, path and thread counts."""
+    intra_op, inter_op = INFERENCE_THREADS
+    return load_model(MODEL_PATH, backend=MODEL_BACKEND, intra_op=intra_op, inter_op=inter_op)
+
+
+async def _prepare_model() -> None:
+    """Load the model (unless preloaded) and warm it up, then mark this worker ready.
+
+    Runs in the background so /health answers while TensorFlow loads; /ready
+    answers 503 until this has finished.
+    """
+    global model, runner, ready, model_digest
+    loaded = model
+    try:
+        try:
+            # Hash the weights, so a swapped model file never gets results cached for the old one
+            digest = await asyncio.to_thread(file_digest, model_file(MODEL_PATH, MODEL_BACKEND))
+        except OSError as e:
+            # Only reachable with a preloaded model: cached results are then this process's own
+            logger.warning("Could not hash the model file (%s); disk cache entries will not be reused", e)
+            digest = f"unhashed-{os.getpid()}-{time.time_ns()}"
+        if loaded is None:
+            print("Loading chess piece recognition model...")
+            start = time.perf_counter()
+            loaded = await asyncio.to_thread(load_configured_model)
+            cold_start['model_load'] = time.perf_counter() - start
+            print(f"Model loaded ({MODEL_BACKEND}). Input shape: {loaded.input_shape}")
+        else:
+            # Assigned before startup by an embedding script; serve.py never does this,
+            # because a loaded model's thread pools do not survive fork()
+            print(f"Using preloaded model in worker pid={os.getpid()}")
+
+        start = time.perf_counter()
+        buckets = batch_buckets(BATCH_MAX_SIZE, min_tiles=LIVE_MAX_CHANGED_TILES)
+        if CASCADE_THRESHOLD > 0:
+            compiled = await asyncio.to_thread(
+                CascadeRunner, loaded, CASCADE_THRESHOLD, buckets, on_call=metrics.record_cascade,
+            )
+        else:
+            compiled = await asyncio.to_thread(InferenceRunner, loaded, buckets)
+        cold_start['compile'] = time.perf_counter() - start
+        if isinstance(compiled, CascadeRunner):
+            # Warm each fold directly: through the cascade, synthetic tiles would count in the
+            # escalation stats and metrics, and the empty board would never reach folds 2+
+            def warm(tiles: np.ndarray) -> None:
+                for fold in compiled.runners:
+                    fold(tiles)
+        else:
+            warm = compiled
+        cold_start['warmup'] = await asyncio.to_thread(warmup, warm, compiled.buckets)
+    except Exception:
+        logger.exception("Model startup failed; the server will not become ready")
+        return
+
+    runner = compiled
+    model = loaded
+    model_digest = digest
+    ready = True
+    logger.info("Ready after cold start: imports %.1f s, model load %.1f s, compile %.1f s, warmup %.1f s",
+                cold_start.get('imports', 0.0), cold_start.get('model_load', 0.0),
+                cold_start['compile'], cold_start['warmup'])
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Load model on startup."""
-    global model
-    print("Loading chess piece recognition model...")
-    model = load_model()
-    print(f"Model loaded. Input shape: {model.input_shape}")
+    """Start the micro-batcher and load and warm up the model in the background."""
+    global batcher
+    batcher = MicroBatcher(
+        lambda squares: runner(squares),
+        max_batch_size=BATCH_MAX_SIZE,
+        max_wait_ms=BATCH_MAX_WAIT_MS,
+        on_batch=_observe_inference,
+    )
+    batcher.start()
+    startup = asyncio.create_task(_prepare_model())
+    job_worker = asyncio.create_task(_job_worker())
     yield
     # Cleanup (if needed)
     print("Shutting down...")
+    startup.cancel()
+    job_worker.cancel()
+    batcher.stop()
+    cpu_executor.shutdown()
+    viz_executor.shutdown()
+
+
+def _observe_inference(boards: float, seconds: float) -> None:
+    metrics.observe_stage("inference", seconds)
+    metrics.INFERENCE_BATCH_BOARDS.observe(boards)
+
+
+def _timed(stage: str, timings: metrics.RequestTimings | None, fn, *args, **kwargs):
+    """Call fn(*args, **kwargs), recording its duration as a metrics stage."""
+    with metrics.timed(stage, timings):
+        return fn(*args, **kwargs)
+
+
+def _model_loading() -> HTTPException:
+    """503 for requests that arrive before this worker's model is compiled and warmed up.
+
+    Gated on `ready` rather than `model`: the model can be set while the
+    runner the micro-batcher calls is still being built.
+    """
+    return HTTPException(
+        status_code=503,
+        detail="Model is loading. Please retry shortly.",
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+    )
+
+
+def _server_busy(retry_after: int) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy. Please retry shortly.",
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """Run a CPU-bound function on the bounded executor.
+
+    Raises:
+        HTTPException: 503 with Retry-After when the executor queue is full
+    """
+    try:
+        return await cpu_executor.run(fn, *args, **kwargs)
+    except ExecutorBusy as e:
+        logger.warning("%s; rejecting request", e)
+        metrics.REJECTED_REQUESTS.labels("queue_full").inc()
+        raise _server_busy(e.retry_after)
+
+
+async def run_viz(fn, *args, **kwargs):
+    """Run a visualization job on the low-priority lane.
+
+    Visualizations are shed first: they are refused as soon as interactive
+    work is queueing on the CPU executor, even if their own lane is free.
+
+    Raises:
+        HTTPException: 503 with Retry-After when shed or when the lane is full
+    """
+    if cpu_executor.queued >= VIZ_SHED_QUEUE:
+        logger.warning("CPU executor has %d queued tasks; shedding visualization", cpu_executor.queued)
+        metrics.REJECTED_REQUESTS.labels("viz_shed").inc()
+        raise _server_busy(RETRY_AFTER_SECONDS)
+    try:
+        return await viz_executor.run(fn, *args, **kwargs)
+    except ExecutorBusy as e:
+        logger.warning("%s; rejecting visualization", e)
+        metrics.REJECTED_REQUESTS.labels("viz_queue_full").inc()
+        raise _server_busy(e.retry_after)
+
+
+async def admit(client: str | None, contents: bytes, *, charge_client: bool = True,
+                wait: bool = False) -> float | None:
+    """Charge an image's pixel cost to its client's budget and this worker's in-flight cap.
+
+    The cost comes from the image header, so nothing is decoded for a
+    request that is turned away. Background jobs (client None) are not
+    charged; they throttle themselves instead. Prefer admitted(); use this
+    when the admission must be released by another task.
+
+    Args:
+        client: Client address, or None to skip admission entirely
+        contents: Uploaded image bytes
+        charge_client: False holds the image to the in-flight cap only
+            (/predict/raw has its own per-IP rate limit)
+        wait: Wait for budget and capacity instead of being rejected, for
+            items of a batch the client has already been admitted for
+
+    Raises:
+        HTTPException: 400 if the header cannot be read, 413 if it exceeds
+            MAX_IMAGE_PIXELS or PIL rejects it as a decompression bomb, 429
+            when the client is over its pixel rate, 503 when the worker's
+            in-flight pixel cap is reached (both with Retry-After; never
+            raised with wait)
+
+    Returns:
+        The charge to pass to release_admission(), or None if nothing was charged
+    """
+    if not admission.enabled or client is None:
+        return None
+    try:
+        width, height = probe_size(contents, MAX_IMAGE_PIXELS)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"{e}. Please upload a smaller screenshot.")
+    except Exception:
+        # Decoding would fail the same way; an unpriced image must not get through
+        raise HTTPException(status_code=400,
+                            detail="Could not read the image. Please upload a valid PNG, JPEG, or WEBP image.")
+
+    cost = admission.cost(width, height)
+    while True:
+        try:
+            charged = admission.acquire(client if charge_client else None, cost)
+            break
+        except AdmissionRejected as e:
+            if not wait:
+                logger.warning("Admission rejected for %s (%dx%d): %s", client, width, height, e)
+                metrics.REJECTED_REQUESTS.labels(f"pixel_{e.reason}").inc()
+                if e.reason == "rate":
+                    raise HTTPException(status_code=429, detail="Too many pixels requested. Please slow down.",
+                                        headers={"Retry-After": str(e.retry_after)})
+                raise HTTPException(status_code=503, detail="Server is busy. Please retry shortly.",
+                                    headers={"Retry-After": str(e.retry_after)})
+            await asyncio.sleep(e.retry_after)
+    metrics.IN_FLIGHT_PIXELS.set(admission.in_flight)
+    return charged
+
+
+def release_admission(charged: float | None) -> None:
+    """Return a charge from admit() to the in-flight budget."""
+    if charged is None:
+        return
+    admission.release(charged)
+    metrics.IN_FLIGHT_PIXELS.set(admission.in_flight)
+
+
+@asynccontextmanager
+async def admitted(client: str | None, contents: bytes, *, charge_client: bool = True, wait: bool = False):
+    """Hold an image's admission (see admit()) for the duration of the block."""
+    charged = await admit(client, contents, charge_client=charge_client, wait=wait)
+    try:
+        yield
+    finally:
+        release_admission(charged)
+
+
+def _empty_squares(tiles: np.ndarray) -> np.ndarray:
+    return empty_square_mask(tiles, max_std=EMPTY_SKIP_MAX_STD, max_edge=EMPTY_SKIP_MAX_EDGE,
+                             max_color_distance=EMPTY_SKIP_MAX_COLOR)
+
+
+async def classify_tiles(tiles: np.ndarray, timings: metrics.RequestTimings | None = None) -> np.ndarray:
+    """Model output for tiles through the shared micro-batcher.
+
+    With EMPTY_SKIP, the confidently empty squares of a whole board are
+    filled in without the model and only the others are submitted.
+    """
+    empty = None
+    if EMPTY_SKIP and len(tiles) == TILES_PER_BOARD:
+        empty = await run_cpu(_timed, "empty_filter", timings, _empty_squares, tiles)
+        metrics.EMPTY_TILES_SKIPPED.inc(int(empty.sum()))
+        if timings is not None:
+            timings.info['empty_skipped'] = int(empty.sum())
+        if empty.all():
+            return merge_predictions(empty, None)
+        tiles = tiles[~empty]
+
+    start = time.perf_counter()
+    predictions = await asyncio.wrap_future(batcher.submit(tiles))
+    if timings is not None:
+        # Includes the wait for the micro-batch; the histogram records model calls instead
+        timings.add("inference", time.perf_counter() - start)
+    return predictions if empty is None else merge_predictions(empty, predictions)
+
+
+async def classify_board(cropped: np.ndarray, active_color: str = "w",
+                         timings: metrics.RequestTimings | None = None) -> dict:
+    """Run piece recognition on a cropped board through the shared micro-batcher.
+
+    A board perceptually identical to one classified before reuses its
+    stored predictions and skips the model.
+    """
+    signature = None
+    if board_index.enabled:
+        signature = await run_cpu(board_signature, cropped)
+        predictions = board_index.lookup(signature)
+        metrics.record_cache_lookup("board", predictions is not None)
+        if timings is not None:
+            timings.info['board_cache'] = "hit" if predictions is not None else "miss"
+        if predictions is not None:
+            logger.info("Board signature cache hit")
+            return predictions_to_fen(predictions, active_color=active_color)
+
+    squares = await run_cpu(_timed, "tile_resize", timings, process_board_for_model, cropped)
+    predictions = await classify_tiles(squares, timings)
+    if signature is not None:
+        board_index.add(signature, predictions)
+    return predictions_to_fen(predictions, active_color=active_color)
 
 
 # Rate limiter
@@ -87,6 +526,16 @@ app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 _raw_origins = os.environ.get("CORS_ORIGINS", "*")
 cors_origins = [o.strip() for o in _raw_origins.split(",") if o.strip()]
 logger.info("CORS_ORIGINS env: %r -> parsed origins: %s", _raw_origins, cors_origins)
+# Enforce body size limits while receiving, before multipart parsing buffers the upload
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_body_size=MAX_FILE_SIZE + MULTIPART_OVERHEAD,
+    path_limits={
+        "/predict-base64": MAX_FILE_SIZE * 4 // 3 + MULTIPART_OVERHEAD,
+        "/predict/batch": BATCH_MAX_UPLOAD_SIZE,
+        "/jobs": JOB_MAX_UPLOAD_SIZE,
+    },
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=cors_origins,
@@ -94,6 +543,8 @@ app.add_middleware(
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["*"],
 )
+# Added last so it is outermost and times the whole request
+app.add_middleware(metrics.RequestMetricsMiddleware)
 
 
 @app.exception_handler(Exception)
@@ -113,9 +564,34 @@ class PredictionResponse(BaseModel):
     confidence: float
     min_confidence: float
     bbox: list[int]
-    annotated_image_base64: str
+    annotated_image_base64: str | None = None
     low_confidence_squares: list[dict]
     links: dict
+    timings: dict | None = None
+
+
+class AnnotationOptions(BaseModel):
+    """How (and whether) to return the annotated image."""
+    format: str = Field(ANNOTATE_FORMAT, pattern="^(none|png|jpeg|webp)$")
+    max_width: int = Field(ANNOTATE_MAX_WIDTH, ge=64, le=8192)
+    quality: int = Field(ANNOTATE_QUALITY, ge=1, le=100)
+
+    def cache_params(self) -> tuple[str, ...]:
+        return (self.format, str(self.max_width), str(self.quality))
+
+
+def annotation_options(
+    annotate: str = Query(ANNOTATE_FORMAT, pattern="^(none|png|jpeg|webp)$",
+                          description="Annotated image format, or 'none' to return only the bbox"),
+    annotate_max_width: int = Query(ANNOTATE_MAX_WIDTH, ge=64, le=8192),
+    annotate_quality: int = Query(ANNOTATE_QUALITY, ge=1, le=100),
+) -> AnnotationOptions:
+    """Annotated image options from query parameters."""
+    return AnnotationOptions(format=annotate, max_width=annotate_max_width, quality=annotate_quality)
+
+
+TIMINGS_DESCRIPTION = ("Include a per-stage timing breakdown (ms, detection threshold levels and refinement, "
+                       "image and crop size) in the response and a Server-Timing header")
 
 
 class PipelineStep(BaseModel):
@@ -131,29 +607,208 @@ class PipelineResponse(BaseModel):
     steps: list[PipelineStep]
 
 
+class CacheStatsResponse(BaseModel):
+    """Response model for /cache/stats endpoint."""
+    result_cache: dict
+    board_cache: dict
+    inflight: dict
+    cascade: dict | None = None
+
+
 class HealthResponse(BaseModel):
     """Response model for /health endpoint."""
     status: str
     model_loaded: bool
+    ready: bool
+
+
+class ReadinessResponse(BaseModel):
+    """Response model for /ready endpoint."""
+    status: str
+    cold_start_seconds: dict[str, float]
 
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
-    """Health check endpoint."""
+    """Liveness check: the process is up and serving, whether or not the model is ready."""
     return HealthResponse(
         status="healthy",
-        model_loaded=model is not None
+        model_loaded=model is not None,
+        ready=ready,
+    )
+
+
+@app.get("/ready", response_model=ReadinessResponse,
+         responses={503: {"model": ReadinessResponse, "description": "Model still loading or warming up"}})
+async def readiness_check():
+    """Readiness check: 200 once the model is loaded and warmed up, 503 until then."""
+    body = ReadinessResponse(
+        status="ready" if ready else "starting",
+        cold_start_seconds={phase: round(seconds, 3) for phase, seconds in cold_start.items()},
+    )
+    return JSONResponse(status_code=200 if ready else 503, content=body.model_dump())
+
+
+def _decode_image(contents: bytes, timings: metrics.RequestTimings | None = None) -> tuple[np.ndarray, int]:
+    """Decode uploaded image bytes into an RGB numpy array within the pixel budget.
+
+    Returns:
+        (RGB image, reduction factor from the full-size image)
+    """
+    try:
+        with metrics.timed("decode", timings):
+            image_array, factor = decode_image(contents, MAX_IMAGE_PIXELS, backend=DECODE_BACKEND,
+                                               max_side=DECODE_MAX_SIDE)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"{e}. Please upload a smaller screenshot.")
+    if timings is not None:
+        timings.info.update({
+            'image_width': image_array.shape[1],
+            'image_height': image_array.shape[0],
+            'decode_reduction': factor,
+        })
+    return image_array, factor
+
+
+def _encode_annotated(image_array: np.ndarray, bbox: tuple, options: AnnotationOptions,
+                      timings: metrics.RequestTimings | None = None) -> str | None:
+    """Draw the detected bbox on a downscaled copy of the image and return it as a data URL.
+
+    Returns None when the annotated image is not requested.
+    """
+    if options.format == "none":
+        return None
+    start = time.perf_counter()
+    annotated = draw_bbox_on_image(image_array, bbox, max_width=options.max_width)
+    annotated_bgr = cv2.cvtColor(annotated, cv2.COLOR_RGB2BGR)
+    drawn = time.perf_counter()
+    ext, mime, params = {
+        "png": (".png", "image/png", [cv2.IMWRITE_PNG_COMPRESSION, 1]),
+        "jpeg": (".jpg", "image/jpeg", [cv2.IMWRITE_JPEG_QUALITY, options.quality]),
+        "webp": (".webp", "image/webp", [cv2.IMWRITE_WEBP_QUALITY, options.quality]),
+    }[options.format]
+    success, buf = cv2.imencode(ext, annotated_bgr, params)
+    if not success:
+        raise RuntimeError(f"Failed to encode annotated image as {options.format}")
+    data_url = f"data:{mime};base64,{base64.b64encode(buf).decode('ascii')}"
+    done = time.perf_counter()
+    metrics.observe_stage("annotate", drawn - start, timings)
+    metrics.observe_stage("encode", done - drawn, timings)
+    logger.info("Annotated image: %s %dx%d, %d bytes in %.1f ms", options.format,
+                annotated.shape[1], annotated.shape[0], len(data_url), (done - start) * 1000)
+    return data_url
+
+
+def _detect_board(image_array: np.ndarray,
+                  timings: metrics.RequestTimings | None = None) -> tuple[np.ndarray, tuple, bool]:
+    """detect_board() with its stage timings recorded as metrics."""
+    detection: dict = {}
+    cropped, bbox, success = detect_board(image_array, timings=detection)
+    metrics.observe_detection(detection, success, timings)
+    if timings is not None and success:
+        timings.info.update({'crop_width': cropped.shape[1], 'crop_height': cropped.shape[0]})
+    return cropped, bbox, success
+
+
+async def _analyze_image(contents: bytes, active_color: str, endpoint: str, client: str | None,
+                         timings: metrics.RequestTimings | None = None, *, charge_client: bool = True,
+                         wait: bool = False) -> tuple[dict, tuple, np.ndarray, int]:
+    """Decode, detect and classify validated image bytes.
+
+    Admission control prices the image first; every CPU-bound stage then
+    runs on the CPU executor so the event loop stays responsive, and
+    inference goes through the shared micro-batcher.
+
+    charge_client and wait are passed to admitted().
+
+    Returns:
+        (predict_fen-style result dict, bbox in decoded image coordinates,
+        decoded RGB image, decode reduction factor)
+    """
+    async with admitted(client, contents, charge_client=charge_client, wait=wait):
+        image_array, factor = await run_cpu(_decode_image, contents, timings)
+        logger.info("%s: image decoded, size=%s, reduction=1/%d", endpoint, image_array.shape[1::-1], factor)
+
+        # Detect board
+        cropped, bbox, success = await run_cpu(_detect_board, image_array, timings)
+        logger.info("%s: board detection success=%s, bbox=%s", endpoint, success, bbox)
+
+        if not success:
+            raise HTTPException(
+                status_code=422,
+                detail="Could not detect chessboard in image. Make sure the board is clearly visible."
+            )
+
+        # Predict FEN
+        result = await classify_board(cropped, active_color=active_color, timings=timings)
+    logger.info("%s: FEN=%s, confidence=%.3f", endpoint, result['fen'], result['avg_confidence'])
+    return result, bbox, image_array, factor
+
+
+def _full_size_bbox(bbox: tuple, factor: int) -> list[int]:
+    """Map a bbox from the (possibly reduced) decoded image back to uploaded image coordinates."""
+    return [int(v) * factor for v in bbox]
+
+
+async def _predict_image(contents: bytes, active_color: str, endpoint: str, client: str | None,
+                         options: AnnotationOptions,
+                         timings: metrics.RequestTimings | None = None) -> PredictionResponse:
+    """Full prediction pipeline for validated image bytes, including the annotated image."""
+    result, bbox, image_array, factor = await _analyze_image(contents, active_color, endpoint, client, timings)
+
+    # Create annotated image with bbox
+    annotated_image_base64 = await run_cpu(_encode_annotated, image_array, bbox, options, timings)
+
+    return PredictionResponse(
+        fen=result['fen'],
+        fen_standard=result['fen_standard'],
+        confidence=result['avg_confidence'],
+        min_confidence=result['min_confidence'],
+        bbox=_full_size_bbox(bbox, factor),
+        annotated_image_base64=annotated_image_base64,
+        low_confidence_squares=result['low_confidence_squares'],
+        links=result['links']
     )
 
 
+def _attach_timings(result: PredictionResponse, response: Response,
+                    timings: metrics.RequestTimings | None) -> PredictionResponse:
+    """Add the requested timing breakdown to the result and as a Server-Timing header."""
+    if timings is not None:
+        result.timings = timings.as_dict()
+        response.headers["Server-Timing"] = timings.server_timing()
+    return result
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus metrics: per-stage latency histograms, cache, queue and failure counters."""
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/cache/stats", response_model=CacheStatsResponse)
+async def cache_stats():
+    """Hit/miss counters of this worker's result and board signature caches, request coalescing
+    and (with CASCADE_THRESHOLD set) the fraction of tiles the inference cascade escalated."""
+    return CacheStatsResponse(result_cache=result_cache.stats(), board_cache=board_index.stats(),
+                              inflight=inflight.stats(),
+                              cascade=runner.stats() if isinstance(runner, CascadeRunner) else None)
+
+
 @app.post("/predict", response_model=PredictionResponse)
 @limiter.limit("10/minute")
-async def predict(request: Request, file: UploadFile = File(...), active_color: str = Query("w", pattern="^[wb]$")):
+async def predict(request: Request, response: Response, file: UploadFile = File(...),
+                  active_color: str = Query("w", pattern="^[wb]$"),
+                  options: AnnotationOptions = Depends(annotation_options),
+                  timings: bool = Query(False, description=TIMINGS_DESCRIPTION)):
     """
     Detect chessboard in image and predict FEN notation.
 
     Args:
         file: Uploaded image file (PNG, JPG, JPEG)
+        options: Annotated image format (none/png/jpeg/webp), max width and quality
+        timings: Include a per-stage timing breakdown and a Server-Timing header
 
     Returns:
         PredictionResponse with FEN, confidence, bbox, annotated image, and analysis links
@@ -162,14 +817,15 @@ async def predict(request: Request, file: UploadFile = File(...), active_color:
                 file.filename, file.content_type, active_color,
                 request.headers.get("origin", "none"))
 
-    if model is None:
-        raise HTTPException(status_code=503, detail="Model not loaded")
+    if not ready:
+        raise _model_loading()
+
+    request_timings = metrics.RequestTimings() if timings else None
 
     # Read and validate file size
-    contents = await file.read()
+    with metrics.timed("upload_read", request_timings):
+        contents = await read_upload_limited(file, MAX_FILE_SIZE)
     logger.info("/predict: read %d bytes", len(contents))
-    if len(contents) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=413, detail="File too large. Maximum size is 10 MB.")
 
     # Validate file type via magic bytes
     if not _is_allowed_image(contents):
@@ -179,76 +835,461 @@ async def predict(request: Request, file: UploadFile = File(...), active_color:
         )
 
     try:
-        # Decode image
-        image = Image.open(io.BytesIO(contents))
-        logger.info("/predict: image decoded, mode=%s, size=%s", image.mode, image.size)
+        result = await _cached_predict_image(contents, active_color, "/predict", get_remote_address(request),
+                                             options, request_timings)
+        logger.info("/predict: returning response successfully")
+        return _attach_timings(result, response, request_timings)
 
-        # Convert to RGB numpy array
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-        image_array = np.array(image)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error processing image in /predict")
+        raise HTTPException(status_code=500, detail="Failed to process image. Please try a different file.")
 
-        # Detect board
-        cropped, bbox, success = detect_board(image_array)
-        logger.info("/predict: board detection success=%s, bbox=%s", success, bbox)
 
-        if not success:
-            raise HTTPException(
-                status_code=422,
-                detail="Could not detect chessboard in image. Make sure the board is clearly visible."
-            )
+async def _cached_predict_image(contents: bytes, active_color: str, endpoint: str, client: str,
+                                options: AnnotationOptions,
+                                timings: metrics.RequestTimings | None = None,
+                                charge_client: bool = True) -> PredictionResponse:
+    """_predict_image() behind the content-addressed result cache.
+
+    Identical requests (same bytes and parameters) arriving while one is
+    being computed wait for that computation instead of running their own.
+    Cache hits and coalesced requests are served without charging the
+    client's admission budget. The caller that starts a computation is
+    admitted before it starts, so an admission rejection goes to that
+    caller only and is never shared with other clients. The computation
+    itself holds that admission until it ends, even if its caller
+    disconnects while others still wait for the result.
+    """
+    # Hashing up to 10 MB off the event loop (hashlib releases the GIL)
+    cache_key = await asyncio.to_thread(content_key, contents, MODEL_CACHE_KEY, model_digest, active_color,
+                                        *options.cache_params())
+    if result_cache.enabled:
+        # A disk-tier lookup reads and parses a file, so keep it off the event loop too
+        cached = await asyncio.to_thread(result_cache.get, cache_key)
+        metrics.record_cache_lookup("result", cached is not None)
+        if timings is not None:
+            timings.info['result_cache'] = "hit" if cached is not None else "miss"
+        if cached is not None:
+            logger.info("%s: result cache hit", endpoint)
+            return PredictionResponse(**cached)
+
+    charged = None
+
+    async def compute() -> PredictionResponse:
+        # Runs shielded from its caller's cancellation, so it owns the caller's admission
+        # (_predict_image() is given no client, which skips admitting it a second time)
+        try:
+            response = await _predict_image(contents, active_color, endpoint, None, options, timings)
+            if result_cache.enabled:
+                await asyncio.to_thread(result_cache.put, cache_key, response.model_dump(exclude={"timings"}))
+            return response
+        finally:
+            release_admission(charged)
+
+    if not inflight.running(cache_key):
+        # Nothing is awaited between the admission and run() unless admit() has to wait,
+        # which it never does here, so this caller is certain to start the computation
+        charged = await admit(client, contents, charge_client=charge_client)
+    response, shared = await inflight.run(cache_key, compute)
+    metrics.record_cache_lookup("inflight", shared)
+    if shared:
+        logger.info("%s: coalesced with an identical in-flight request", endpoint)
+        if timings is not None:
+            timings.info['coalesced'] = True
+    # Each caller gets its own copy, since endpoints attach per-request timings to it
+    return response.model_copy()
+
+
+class BatchItemResult(BaseModel):
+    """One line of the /predict/batch NDJSON stream."""
+    index: int
+    filename: str
+    status_code: int = 200
+    error: str | None = None
+    fen: str | None = None
+    fen_standard: str | None = None
+    confidence: float | None = None
+    min_confidence: float | None = None
+    bbox: list[int] | None = None
+    low_confidence_squares: list[dict] | None = None
+    links: dict | None = None
+    timings: dict | None = None
+
+
+def _spool_upload(upload: UploadFile) -> BinaryIO:
+    """Copy an upload into a temp file owned by the caller.
+
+    FastAPI closes request files when the endpoint returns, which is before a
+    streaming response has finished reading them.
+    """
+    spooled = tempfile.TemporaryFile()
+    upload.file.seek(0)
+    shutil.copyfileobj(upload.file, spooled, 1024 * 1024)
+    spooled.seek(0)
+    return spooled
+
+
+async def _iter_batch_inputs(spooled: list[tuple[str, BinaryIO]]):
+    """Yield (filename, bytes-or-exception) for every image in the uploaded files and archives."""
+    for filename, fileobj in spooled:
+        head = fileobj.read(len(ZIP_MAGIC))
+        fileobj.seek(0)
+        if not is_archive(head, filename):
+            data = fileobj.read(MAX_FILE_SIZE + 1)
+            yield filename, (ArchiveMemberTooLarge() if len(data) > MAX_FILE_SIZE else data)
+            continue
+
+        members = iter_archive(fileobj, MAX_FILE_SIZE)
+        while True:
+            try:
+                # Decompression is blocking I/O: pull one member at a time off-loop
+                entry = await asyncio.to_thread(next, members, None)
+            except ArchiveError as e:
+                yield filename, e
+                break
+            if entry is None:
+                break
+            name, data = entry
+            yield f"{filename}/{name}", data
+
+
+async def _predict_batch_item(index: int, filename: str, data: bytes | Exception,
+                              active_color: str, client: str | None, timings: bool = False) -> BatchItemResult:
+    """Run one batch item through the pipeline, turning failures into a per-item error."""
+    if isinstance(data, ArchiveMemberTooLarge):
+        return BatchItemResult(index=index, filename=filename, status_code=413,
+                               error="File too large. Maximum size is 10 MB.")
+    if isinstance(data, Exception):
+        return BatchItemResult(index=index, filename=filename, status_code=400, error=str(data))
+    if not _is_allowed_image(data):
+        return BatchItemResult(index=index, filename=filename, status_code=400,
+                               error="Unsupported image format. Please upload a PNG, JPEG, or WEBP image.")
+
+    item_timings = metrics.RequestTimings() if timings else None
+    try:
+        # The batch was admitted by its request rate limit; items wait for pixel
+        # budget instead of failing, since nobody retries a single NDJSON line
+        result, bbox, _, factor = await _analyze_image(data, active_color, "/predict/batch", client, item_timings,
+                                                       wait=True)
+    except HTTPException as e:
+        return BatchItemResult(index=index, filename=filename, status_code=e.status_code, error=e.detail)
+    except Exception:
+        logger.exception("Error processing %s in /predict/batch", filename)
+        return BatchItemResult(index=index, filename=filename, status_code=500,
+                               error="Failed to process image. Please try a different file.")
+
+    return BatchItemResult(
+        index=index,
+        filename=filename,
+        fen=result['fen'],
+        fen_standard=result['fen_standard'],
+        confidence=result['avg_confidence'],
+        min_confidence=result['min_confidence'],
+        bbox=_full_size_bbox(bbox, factor),
+        low_confidence_squares=result['low_confidence_squares'],
+        links=result['links'],
+        timings=item_timings.as_dict() if item_timings is not None else None,
+    )
 
-        # Predict FEN
-        result = predict_fen(model, cropped, active_color=active_color)
-        logger.info("/predict: FEN=%s, confidence=%.3f", result['fen'], result['avg_confidence'])
-
-        # Create annotated image with bbox
-        annotated = draw_bbox_on_image(image_array, bbox)
-
-        # Convert annotated image to base64
-        annotated_pil = Image.fromarray(annotated)
-        buffer = io.BytesIO()
-        annotated_pil.save(buffer, format="PNG")
-        annotated_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
-
-        response = PredictionResponse(
-            fen=result['fen'],
-            fen_standard=result['fen_standard'],
-            confidence=result['avg_confidence'],
-            min_confidence=result['min_confidence'],
-            bbox=list(bbox),
-            annotated_image_base64=f"data:image/png;base64,{annotated_base64}",
-            low_confidence_squares=result['low_confidence_squares'],
-            links=result['links']
+
+async def _read_body_limited(request: Request, limit: int) -> bytes:
+    """Read the raw request body, failing with 413 as soon as it exceeds limit bytes."""
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+        raise HTTPException(status_code=413, detail="File too large. Maximum size is 10 MB.")
+
+    chunks = []
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise HTTPException(status_code=413, detail="File too large. Maximum size is 10 MB.")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+@app.post("/predict/raw", response_model=PredictionResponse)
+@limiter.limit(RAW_RATE_LIMIT)
+async def predict_raw(request: Request, response: Response, active_color: str = Query("w", pattern="^[wb]$"),
+                      options: AnnotationOptions = Depends(annotation_options),
+                      timings: bool = Query(False, description=TIMINGS_DESCRIPTION)):
+    """
+    Same as /predict, for an image sent as the raw request body.
+
+    Skips multipart parsing and base64: the body is the image file itself,
+    sent with Content-Type application/octet-stream or image/*.
+
+    Returns:
+        PredictionResponse, as /predict
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type != "application/octet-stream" and not content_type.startswith("image/"):
+        raise HTTPException(
+            status_code=415,
+            detail="Send the image as the request body with Content-Type application/octet-stream or image/*."
+        )
+
+    if not ready:
+        raise _model_loading()
+
+    request_timings = metrics.RequestTimings() if timings else None
+    with metrics.timed("upload_read", request_timings):
+        contents = await _read_body_limited(request, MAX_FILE_SIZE)
+    logger.info("/predict/raw: read %d bytes", len(contents))
+
+    if not _is_allowed_image(contents):
+        raise HTTPException(
+            status_code=400,
+            detail="Unsupported image format. Please upload a PNG, JPEG, or WEBP image."
         )
-        logger.info("/predict: returning response successfully")
-        return response
+
+    try:
+        # RAW_RATE_LIMIT is this endpoint's budget; only the in-flight pixel cap applies
+        result = await _cached_predict_image(contents, active_color, "/predict/raw", get_remote_address(request),
+                                             options, request_timings, charge_client=False)
+        return _attach_timings(result, response, request_timings)
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.exception("Error processing image in /predict")
+        logger.exception("Error processing image in /predict/raw")
         raise HTTPException(status_code=500, detail="Failed to process image. Please try a different file.")
 
 
+@app.post("/predict/batch")
+@limiter.limit("2/minute")
+async def predict_batch(request: Request, files: list[UploadFile] = File(...),
+                        active_color: str = Query("w", pattern="^[wb]$"),
+                        timings: bool = Query(False, description="Include a per-stage timing breakdown per image")):
+    """
+    Predict FENs for many images in one request.
+
+    Accepts several image files and/or zip/tar archives of images. Boards are
+    detected in parallel and classified together by the micro-batcher; one
+    JSON line (BatchItemResult) is streamed per image as soon as it is ready,
+    in completion order. A failing image yields an error line and does not
+    abort the batch.
+
+    Returns:
+        application/x-ndjson stream of BatchItemResult objects
+    """
+    if not ready:
+        raise _model_loading()
+
+    logger.info("/predict/batch called: %d uploads, active_color=%s", len(files), active_color)
+    client = get_remote_address(request)
+    spooled = [(upload.filename or f"upload-{i}", await asyncio.to_thread(_spool_upload, upload))
+               for i, upload in enumerate(files)]
+
+    async def stream():
+        # Bound concurrency so one batch cannot fill the CPU executor's queue
+        slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+        pending: set[asyncio.Task] = set()
+
+        async def run(index, filename, data):
+            async with slots:
+                return await _predict_batch_item(index, filename, data, active_color, client, timings)
+
+        def lines(done):
+            return [task.result().model_dump_json(exclude_none=True) + "\n" for task in done]
+
+        try:
+            index = 0
+            async for filename, data in _iter_batch_inputs(spooled):
+                if index >= BATCH_MAX_ITEMS:
+                    yield BatchItemResult(
+                        index=index, filename=filename, status_code=413,
+                        error=f"Batch limit of {BATCH_MAX_ITEMS} images reached; remaining files skipped.",
+                    ).model_dump_json(exclude_none=True) + "\n"
+                    break
+                pending.add(asyncio.create_task(run(index, filename, data)))
+                index += 1
+
+                # Apply backpressure on archive reading and emit whatever has finished
+                if len(pending) >= 2 * BATCH_CONCURRENCY:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    done = {task for task in pending if task.done()}
+                    pending -= done
+                for line in lines(done):
+                    yield line
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for line in lines(done):
+                    yield line
+        finally:
+            for task in pending:
+                task.cancel()
+            for _, fileobj in spooled:
+                fileobj.close()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+class JobStatusResponse(BaseModel):
+    """Response model for /jobs endpoints."""
+    job_id: str
+    status: str  # queued | running | done | failed
+    processed: int
+    failed: int
+    total: int | None  # known once every input has been read
+    error: str | None = None
+    created_at: float
+    updated_at: float
+    results: list[BatchItemResult] = []
+    links: dict
+
+
+def _job_status(state: dict, results: list[dict] | None = None) -> JobStatusResponse:
+    return JobStatusResponse(
+        job_id=state['job_id'],
+        status=state['status'],
+        processed=state['processed'],
+        failed=state['failed'],
+        total=state['total'],
+        error=state['error'],
+        created_at=state['created_at'],
+        updated_at=state['updated_at'],
+        results=results or [],
+        links={'status': f"/jobs/{state['job_id']}"},
+    )
+
+
+async def _job_worker() -> None:
+    """Background loop of each worker process: claim spooled jobs and process them."""
+    while True:
+        try:
+            claim = await asyncio.to_thread(job_spool.claim_next) if ready else None
+            if claim is None:
+                await asyncio.to_thread(job_spool.prune)
+                await asyncio.sleep(JOB_POLL_SECONDS)
+                continue
+            try:
+                await _run_job(claim)
+            finally:
+                claim.release()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Job worker error")
+            await asyncio.sleep(JOB_POLL_SECONDS)
+
+
+async def _run_job(claim: JobClaim) -> None:
+    """Process a claimed job one image at a time, resuming after its last stored result.
+
+    Jobs run through the same pipeline as /predict/batch but yield to
+    interactive requests: no new image starts while CPU work is queueing,
+    and an image refused for lack of capacity is retried instead of failed.
+    """
+    state = await asyncio.to_thread(claim.update, status='running')
+    logger.info("Job %s: starting at item %d", claim.job_id, claim.completed)
+    active_color = state['params'].get('active_color', 'w')
+    files = [(name, path.open("rb")) for name, path in job_spool.inputs(claim)]
+    try:
+        index = 0
+        async for filename, data in _iter_batch_inputs(files):
+            if index < claim.completed:
+                index += 1  # processed before a restart
+                continue
+            if index >= JOB_MAX_ITEMS:
+                await asyncio.to_thread(claim.append, BatchItemResult(
+                    index=index, filename=filename, status_code=413,
+                    error=f"Job limit of {JOB_MAX_ITEMS} images reached; remaining files skipped.",
+                ).model_dump(exclude_none=True))
+                break
+            while True:
+                while cpu_executor.queued > 0:
+                    await asyncio.sleep(0.05)
+                item = await _predict_batch_item(index, filename, data, active_color, None)
+                if item.status_code != 503:
+                    break
+                await asyncio.sleep(RETRY_AFTER_SECONDS)
+            await asyncio.to_thread(claim.append, item.model_dump(exclude_none=True))
+            index += 1
+        await asyncio.to_thread(claim.update, status='done', total=claim.completed)
+        logger.info("Job %s: done, %d images (%d failed)", claim.job_id, claim.completed, claim.failed)
+    except asyncio.CancelledError:
+        # Shutting down: leave the job unfinished for the next worker to resume
+        raise
+    except Exception as e:
+        logger.exception("Job %s failed", claim.job_id)
+        await asyncio.to_thread(claim.update, status='failed', error=str(e))
+    finally:
+        for _, fileobj in files:
+            fileobj.close()
+
+
+@app.post("/jobs", response_model=JobStatusResponse, status_code=202)
+@limiter.limit("5/minute")
+async def create_job(request: Request, files: list[UploadFile] = File(...),
+                     active_color: str = Query("w", pattern="^[wb]$")):
+    """
+    Queue images and/or zip/tar archives for background processing.
+
+    The uploads are spooled to disk and the job id is returned at once;
+    poll GET /jobs/{job_id} for progress and results. Jobs survive worker
+    restarts: an interrupted job is resumed after its last stored result.
+
+    Returns:
+        JobStatusResponse of the queued job (HTTP 202)
+    """
+    logger.info("/jobs called: %d uploads, active_color=%s", len(files), active_color)
+    uploads = [(upload.filename or f"upload-{i}", upload.file) for i, upload in enumerate(files)]
+    try:
+        job_id = await asyncio.to_thread(job_spool.create, uploads, {'active_color': active_color})
+    except SpoolFull as e:
+        logger.warning("/jobs: %s", e)
+        raise HTTPException(status_code=503, detail="Job queue is full. Please retry later.",
+                            headers={"Retry-After": "60"})
+    logger.info("/jobs: queued job %s", job_id)
+    return _job_status(job_spool.state(job_id))
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse, response_model_exclude_none=True)
+async def get_job(job_id: str, offset: int = Query(0, ge=0, description="Skip this many results"),
+                  limit: int = Query(1000, ge=0, le=10000, description="Maximum results returned")):
+    """Progress of a background job and its results so far, in input order."""
+    state = await asyncio.to_thread(job_spool.state, job_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    results = await asyncio.to_thread(job_spool.results, job_id, offset, limit)
+    return _job_status(state, results)
+
+
 @app.post("/predict-base64")
 @limiter.limit("10/minute")
-async def predict_base64(request: Request, data: dict):
+async def predict_base64(request: Request, response: Response, data: dict):
     """
     Alternative endpoint that accepts base64-encoded image.
 
     Args:
-        data: Dict with 'image' key containing base64-encoded image data
+        data: Dict with 'image' key containing base64-encoded image data, and
+            optional 'annotate', 'annotate_max_width', 'annotate_quality' and
+            'timings' keys with the same meaning as the /predict query parameters
 
     Returns:
         Same as /predict endpoint
     """
-    if model is None:
-        raise HTTPException(status_code=503, detail="Model not loaded")
+    if not ready:
+        raise _model_loading()
 
     if 'image' not in data:
         raise HTTPException(status_code=400, detail="Missing 'image' field")
 
+    try:
+        options = AnnotationOptions(
+            format=data.get('annotate', ANNOTATE_FORMAT),
+            max_width=data.get('annotate_max_width', ANNOTATE_MAX_WIDTH),
+            quality=data.get('annotate_quality', ANNOTATE_QUALITY),
+        )
+    except ValidationError:
+        raise HTTPException(status_code=400, detail="Invalid annotation options")
+    request_timings = metrics.RequestTimings() if data.get('timings') is True else None
+
     try:
         # Decode base64 image
         image_data = data['image']
@@ -256,7 +1297,7 @@ async def predict_base64(request: Request, data: dict):
             # Remove data URL prefix if present
             image_data = image_data.split(',')[1]
 
-        image_bytes = base64.b64decode(image_data)
+        image_bytes = await run_cpu(_timed, "upload_read", request_timings, base64.b64decode, image_data)
 
         # Validate file size
         if len(image_bytes) > MAX_FILE_SIZE:
@@ -269,44 +1310,9 @@ async def predict_base64(request: Request, data: dict):
                 detail="Unsupported image format. Please upload a PNG, JPEG, or WEBP image."
             )
 
-        image = Image.open(io.BytesIO(image_bytes))
-
-        # Convert to RGB numpy array
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-        image_array = np.array(image)
-
-        # Detect board
-        cropped, bbox, success = detect_board(image_array)
-
-        if not success:
-            raise HTTPException(
-                status_code=422,
-                detail="Could not detect chessboard in image. Make sure the board is clearly visible."
-            )
-
-        # Predict FEN
-        result = predict_fen(model, cropped)
-
-        # Create annotated image with bbox
-        annotated = draw_bbox_on_image(image_array, bbox)
-
-        # Convert annotated image to base64
-        annotated_pil = Image.fromarray(annotated)
-        buffer = io.BytesIO()
-        annotated_pil.save(buffer, format="PNG")
-        annotated_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
-
-        return {
-            'fen': result['fen'],
-            'fen_standard': result['fen_standard'],
-            'confidence': result['avg_confidence'],
-            'min_confidence': result['min_confidence'],
-            'bbox': list(bbox),
-            'annotated_image_base64': f"data:image/png;base64,{annotated_base64}",
-            'low_confidence_squares': result['low_confidence_squares'],
-            'links': result['links']
-        }
+        result = await _cached_predict_image(image_bytes, "w", "/predict-base64", get_remote_address(request),
+                                             options, request_timings)
+        return _attach_timings(result, response, request_timings).model_dump()
 
     except HTTPException:
         raise
@@ -315,6 +1321,191 @@ async def predict_base64(request: Request, data: dict):
         raise HTTPException(status_code=500, detail="Failed to process image. Please try a different file.")
 
 
+def _build_pipeline_steps(contents: bytes) -> list[PipelineStep]:
+    """Run detection with intermediates and render each visualization step."""
+    image_array, _ = _decode_image(contents)
+
+    # Run detection with intermediates
+    cropped, bbox, success, intermediates = detect_board_with_intermediates(image_array)
+
+    steps: list[PipelineStep] = []
+
+    # Step 1: Finding the Board
+    crop_png = viz_rough_crop(
+        intermediates['original'],
+        intermediates['crop_bbox'],
+        intermediates['crop_found'],
+    )
+    steps.append(PipelineStep(
+        key="rough_crop",
+        title="Finding the Board",
+        description="Canny edge detection and contour analysis locate the board region, filtering out browser chrome, sidebars, and eval bars.",
+        image_base64=f"data:image/png;base64,{base64.b64encode(crop_png).decode()}",
+    ))
+
+    # Step 2: Enhancing Contrast
+    eq_png = viz_equalized(intermediates['equalized'])
+    steps.append(PipelineStep(
+        key="equalized",
+        title="Enhancing Contrast",
+        description="Histogram equalization normalizes lighting so grid lines stand out regardless of board theme.",
+        image_base64=f"data:image/png;base64,{base64.b64encode(eq_png).decode()}",
+    ))
+
+    # Step 3: Computing Edge Gradients
+    grad_png = viz_gradients(intermediates['grad_x'], intermediates['grad_y'])
+    steps.append(PipelineStep(
+        key="gradients",
+        title="Computing Edge Gradients",
+        description="A large Sobel kernel (31x31) detects edges while smoothing out piece-level detail.",
+        image_base64=f"data:image/png;base64,{base64.b64encode(grad_png).decode()}",
+    ))
+
+    # Step 4: Projecting Gradients
+    proj_png = viz_projections(
+        intermediates['hough_Dx'],
+        intermediates['hough_Dy'],
+        intermediates['lines_x'],
+        intermediates['lines_y'],
+    )
+    steps.append(PipelineStep(
+        key="projections",
+        title="Projecting Gradients",
+        description="Positive and negative gradients are multiplied along each axis. Only real grid lines \u2014 which have both dark-to-light and light-to-dark transitions \u2014 produce strong peaks.",
+        image_base64=f"data:image/png;base64,{base64.b64encode(proj_png).decode()}",
+    ))
+
+    # Step 5: Detecting Grid Lines (only if detection succeeded)
+    if success and intermediates['all_x'] and intermediates['all_y']:
+        grid_png = viz_grid_lines(
+            intermediates['working_image'],
+            intermediates['all_x'],
+            intermediates['all_y'],
+        )
+        steps.append(PipelineStep(
+            key="grid_lines",
+            title="Detecting Grid Lines",
+            description="An adaptive threshold finds 7 equally-spaced interior lines per axis. Adding outer boundaries gives the full 9x9 grid.",
+            image_base64=f"data:image/png;base64,{base64.b64encode(grid_png).decode()}",
+        ))
+    else:
+        steps.append(PipelineStep(
+            key="grid_lines",
+            title="Detecting Grid Lines",
+            description="Grid line detection was unsuccessful. The adaptive threshold could not find 7 equally-spaced interior lines per axis.",
+            image_base64=None,
+        ))
+
+    # Step 6: Classifying Squares (text-only)
+    steps.append(PipelineStep(
+        key="classification",
+        title="Classifying Squares",
+        description="The detected board is divided into 64 squares (40x40 pixels each). A CNN ensemble classifies each square as one of 13 classes: 6 white pieces, 6 black pieces, or empty.",
+        image_base64=None,
+    ))
+
+    return steps
+
+
+@app.websocket("/ws/live")
+async def live_stream(websocket: WebSocket, active_color: str = Query("w", pattern="^[wb]$")):
+    """
+    Follow a live board from a stream of screenshots.
+
+    The client sends frames as binary messages (PNG, JPEG or WEBP). The
+    server keeps the board location between frames, re-classifies only the
+    squares whose pixels changed, and sends a JSON message only when the
+    position changes. If frames arrive faster than they can be processed,
+    only the newest waiting frame is kept.
+
+    Messages sent:
+        {"fen", "fen_standard", "confidence", "min_confidence", "bbox",
+         "changed_squares", "redetected", "links"} on a new position
+        {"status": "no_board"} when the board is lost
+        {"error": ...} for an unusable frame
+    """
+    await websocket.accept()
+    if not ready:
+        await websocket.close(code=1013, reason="Model is loading")
+        return
+
+    tracker = LiveBoardTracker(LIVE_TILE_THRESHOLD, LIVE_MAX_CHANGED_TILES)
+    latest: list[bytes] = []
+    frame_ready = asyncio.Event()
+    closed = False
+
+    async def receive_frames():
+        nonlocal closed
+        try:
+            while True:
+                frame = await websocket.receive_bytes()
+                # Keep only the newest frame: a slow server skips frames instead of lagging
+                latest[:] = [frame]
+                frame_ready.set()
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            # e.g. a text message (KeyError on its missing bytes): end the stream as closed
+            logger.warning("/ws/live: receiver stopped: %r", e)
+        finally:
+            # Always wake the main loop, or it would wait on frame_ready forever
+            closed = True
+            frame_ready.set()
+
+    receiver = asyncio.create_task(receive_frames())
+    board_visible = True
+    try:
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            if closed:
+                break
+            frame = latest.pop()
+
+            if len(frame) > MAX_FILE_SIZE or not _is_allowed_image(frame):
+                await websocket.send_json({"error": "Frames must be PNG, JPEG or WEBP images up to 10 MB."})
+                continue
+
+            try:
+                image_array, factor = await run_cpu(_decode_image, frame)
+                plan = await run_cpu(tracker.plan, image_array)
+                predictions = None
+                if plan is not None and plan.tiles is not None:
+                    predictions = await classify_tiles(plan.tiles)
+            except HTTPException as e:
+                await websocket.send_json({"error": e.detail})
+                continue
+            except Exception:
+                # Truncated or undecodable frame: skip it, the tracker state is untouched
+                logger.exception("/ws/live: could not process frame")
+                await websocket.send_json({"error": "Could not process this frame."})
+                continue
+
+            if plan is None:
+                if board_visible:
+                    await websocket.send_json({"status": "no_board"})
+                board_visible = False
+                continue
+            board_visible = True
+
+            result = tracker.commit(plan, predictions, active_color=active_color)
+            if result is not None:
+                await websocket.send_json({
+                    'fen': result['fen'],
+                    'fen_standard': result['fen_standard'],
+                    'confidence': result['avg_confidence'],
+                    'min_confidence': result['min_confidence'],
+                    'bbox': _full_size_bbox(plan.bbox, factor),
+                    'changed_squares': int(plan.changed.sum()),
+                    'redetected': plan.redetected,
+                    'links': result['links'],
+                })
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+
+
 @app.post("/predict/pipeline", response_model=PipelineResponse)
 @limiter.limit("5/minute")
 async def predict_pipeline(request: Request, file: UploadFile = File(...)):
@@ -324,9 +1515,8 @@ async def predict_pipeline(request: Request, file: UploadFile = File(...)):
     Returns images and descriptions for each stage of the detection process.
     """
     # Read and validate file
-    contents = await file.read()
-    if len(contents) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=413, detail="File too large. Maximum size is 10 MB.")
+    with metrics.timed("upload_read"):
+        contents = await read_upload_limited(file, MAX_FILE_SIZE)
 
     if not _is_allowed_image(contents):
         raise HTTPException(
@@ -335,90 +1525,8 @@ async def predict_pipeline(request: Request, file: UploadFile = File(...)):
         )
 
     try:
-        image = Image.open(io.BytesIO(contents))
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-        image_array = np.array(image)
-
-        # Run detection with intermediates
-        cropped, bbox, success, intermediates = detect_board_with_intermediates(image_array)
-
-        steps: list[PipelineStep] = []
-
-        # Step 1: Finding the Board
-        crop_png = viz_rough_crop(
-            intermediates['original'],
-            intermediates['crop_bbox'],
-            intermediates['crop_found'],
-        )
-        steps.append(PipelineStep(
-            key="rough_crop",
-            title="Finding the Board",
-            description="Canny edge detection and contour analysis locate the board region, filtering out browser chrome, sidebars, and eval bars.",
-            image_base64=f"data:image/png;base64,{base64.b64encode(crop_png).decode()}",
-        ))
-
-        # Step 2: Enhancing Contrast
-        eq_png = viz_equalized(intermediates['equalized'])
-        steps.append(PipelineStep(
-            key="equalized",
-            title="Enhancing Contrast",
-            description="Histogram equalization normalizes lighting so grid lines stand out regardless of board theme.",
-            image_base64=f"data:image/png;base64,{base64.b64encode(eq_png).decode()}",
-        ))
-
-        # Step 3: Computing Edge Gradients
-        grad_png = viz_gradients(intermediates['grad_x'], intermediates['grad_y'])
-        steps.append(PipelineStep(
-            key="gradients",
-            title="Computing Edge Gradients",
-            description="A large Sobel kernel (31x31) detects edges while smoothing out piece-level detail.",
-            image_base64=f"data:image/png;base64,{base64.b64encode(grad_png).decode()}",
-        ))
-
-        # Step 4: Projecting Gradients
-        proj_png = viz_projections(
-            intermediates['hough_Dx'],
-            intermediates['hough_Dy'],
-            intermediates['lines_x'],
-            intermediates['lines_y'],
-        )
-        steps.append(PipelineStep(
-            key="projections",
-            title="Projecting Gradients",
-            description="Positive and negative gradients are multiplied along each axis. Only real grid lines \u2014 which have both dark-to-light and light-to-dark transitions \u2014 produce strong peaks.",
-            image_base64=f"data:image/png;base64,{base64.b64encode(proj_png).decode()}",
-        ))
-
-        # Step 5: Detecting Grid Lines (only if detection succeeded)
-        if success and intermediates['all_x'] and intermediates['all_y']:
-            grid_png = viz_grid_lines(
-                intermediates['working_image'],
-                intermediates['all_x'],
-                intermediates['all_y'],
-            )
-            steps.append(PipelineStep(
-                key="grid_lines",
-                title="Detecting Grid Lines",
-                description="An adaptive threshold finds 7 equally-spaced interior lines per axis. Adding outer boundaries gives the full 9x9 grid.",
-                image_base64=f"data:image/png;base64,{base64.b64encode(grid_png).decode()}",
-            ))
-        else:
-            steps.append(PipelineStep(
-                key="grid_lines",
-                title="Detecting Grid Lines",
-                description="Grid line detection was unsuccessful. The adaptive threshold could not find 7 equally-spaced interior lines per axis.",
-                image_base64=None,
-            ))
-
-        # Step 6: Classifying Squares (text-only)
-        steps.append(PipelineStep(
-            key="classification",
-            title="Classifying Squares",
-            description="The detected board is divided into 64 squares (40x40 pixels each). A CNN ensemble classifies each square as one of 13 classes: 6 white pieces, 6 black pieces, or empty.",
-            image_base64=None,
-        ))
-
+        async with admitted(get_remote_address(request), contents):
+            steps = await run_viz(_build_pipeline_steps, contents)
         return PipelineResponse(steps=steps)
 
     except HTTPException:
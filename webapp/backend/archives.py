@@ -0,0 +1,129 @@
+"""
+Archive Readers for Batch Uploads
+
+Yields the member files of a zip or tar upload one at a time, so a batch
+never needs the whole decompressed archive in memory:
+- zip: members are decompressed one by one from the (seekable) upload file
+- tar (optionally gz/bz2/xz compressed): read sequentially in stream mode
+
+A corrupt member is yielded as an ArchiveError in place of its data. A zip
+then continues with the next member; a tar stream cannot be resynchronised,
+so it ends at the first corrupt member.
+"""
+
+import lzma
+import tarfile
+import zipfile
+import zlib
+from typing import BinaryIO, Iterator
+
+ZIP_MAGIC = b'PK\x03\x04'
+
+# Raised while decompressing or reading a damaged member (CRC mismatch, corrupt
+# deflate/lzma data, truncated stream)
+_READ_ERRORS = (zlib.error, lzma.LZMAError, zipfile.BadZipFile, tarfile.TarError, OSError, EOFError)
+
+
+class ArchiveError(Exception):
+    """Raised when an upload is not a readable zip or tar archive.
+
+    Also yielded (per member) in place of the data of a member that cannot
+    be read.
+    """
+
+
+class ArchiveMemberTooLarge(Exception):
+    """Raised (per member) when a file in the archive exceeds the size limit."""
+
+
+def is_archive(head: bytes, filename: str | None = None) -> bool:
+    """Guess whether an upload is an archive from its first bytes or its filename."""
+    if head.startswith(ZIP_MAGIC):
+        return True
+    name = (filename or "").lower()
+    return name.endswith((".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz"))
+
+
+def _skip_member(name: str) -> bool:
+    """Skip directory entries and OS metadata files (e.g. macOS resource forks)."""
+    base = name.rsplit("/", 1)[-1]
+    return name.startswith("__MACOSX/") or base.startswith(".") or not base
+
+
+def _read_limited(stream: BinaryIO, max_size: int) -> bytes:
+    data = stream.read(max_size + 1)
+    if len(data) > max_size:
+        raise ArchiveMemberTooLarge()
+    return data
+
+
+def iter_archive(fileobj: BinaryIO, max_member_size: int) -> Iterator[tuple[str, bytes | Exception]]:
+    """Yield (member_name, data) for each regular file in a zip or tar archive.
+
+    Members larger than max_member_size are yielded with an
+    ArchiveMemberTooLarge instance instead of their data, and unreadable
+    members with an ArchiveError, so the caller can report them without
+    aborting the rest of the upload. A tar stream stops after its first
+    unreadable member.
+
+    Args:
+        fileobj: Binary file object positioned at the start of the archive
+        max_member_size: Maximum decompressed size of a single member in bytes
+
+    Raises:
+        ArchiveError: If the upload is neither a zip nor a tar archive
+    """
+    head = fileobj.read(len(ZIP_MAGIC))
+    fileobj.seek(0)
+
+    if head == ZIP_MAGIC:
+        try:
+            archive = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile as e:
+            raise ArchiveError(f"Invalid zip archive: {e}") from e
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir() or _skip_member(info.filename):
+                    continue
+                if info.file_size > max_member_size:
+                    yield info.filename, ArchiveMemberTooLarge()
+                    continue
+                try:
+                    with archive.open(info) as member:
+                        data = _read_limited(member, max_member_size)
+                except ArchiveMemberTooLarge as e:
+                    data = e
+                except _READ_ERRORS as e:
+                    data = ArchiveError(f"Corrupt archive member: {e}")
+                yield info.filename, data
+        return
+
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode="r|*")
+    except tarfile.TarError as e:
+        raise ArchiveError(f"Unsupported archive: {e}") from e
+    with archive:
+        members = iter(archive)
+        while True:
+            name = "(truncated)"  # a failure before the next header is read
+            try:
+                info = next(members, None)
+                if info is None:
+                    return
+                name = info.name
+                if not info.isfile() or _skip_member(name):
+                    continue
+                if info.size > max_member_size:
+                    data = ArchiveMemberTooLarge()
+                else:
+                    member = archive.extractfile(info)
+                    if member is None:
+                        continue
+                    data = _read_limited(member, max_member_size)
+            except ArchiveMemberTooLarge as e:
+                data = e
+            except _READ_ERRORS as e:
+                # The stream position is lost: report the damage and end the archive
+                yield name, ArchiveError(f"Corrupt or truncated archive, later members not read: {e}")
+                return
+            yield name, data
@@ -0,0 +1,136 @@
+"""
+Dynamic Micro-Batching for Model Inference
+
+Concurrent requests each produce a (64, 40, 40, 3) tile tensor. Instead of
+paying the fixed per-call overhead of the model once per board, a single
+background thread gathers pending tensors into one batch and runs the model
+once, then hands each caller back its own rows.
+
+A batch is flushed when either:
+- it holds max_batch_size boards, or
+- max_wait_ms has passed since the first tensor of the batch arrived
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+import numpy as np
+
+from fen_generator import TILES_PER_BOARD
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Collect tile tensors from many callers and run them through the model together.
+
+    Args:
+        predict_fn: Callable taking an (N, 40, 40, 3) array and returning (N, 13)
+        max_batch_size: Maximum number of boards (64 tiles each) per model call
+        max_wait_ms: Maximum time the first queued board waits for company
+        on_batch: Optional callback(boards, seconds) invoked after each model call
+    """
+
+    def __init__(self, predict_fn: Callable[[np.ndarray], np.ndarray],
+                 max_batch_size: int = 8, max_wait_ms: float = 5.0,
+                 on_batch: Callable[[float, float], None] | None = None):
+        self.predict_fn = predict_fn
+        self.on_batch = on_batch
+        self.max_rows = max(1, max_batch_size) * TILES_PER_BOARD
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._pending: tuple[np.ndarray, Future] | None = None
+
+    def start(self) -> None:
+        """Start the background batching thread."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the batching thread once the queued work has been served."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, tiles: np.ndarray) -> Future:
+        """Queue tiles for inference.
+
+        Args:
+            tiles: Array of shape (N, 40, 40, 3), usually N = 64
+
+        Returns:
+            Future resolving to the (N, 13) model output for these tiles
+        """
+        future: Future = Future()
+        self._queue.put((tiles, future))
+        return future
+
+    def _next_item(self, timeout: float | None):
+        if self._pending is not None:
+            item, self._pending = self._pending, None
+            return item
+        return self._queue.get(timeout=timeout) if timeout is not None else self._queue.get()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._next_item(None)
+            if first is None:
+                break
+            batch = [first]
+            rows = len(first[0])
+            deadline = time.monotonic() + self.max_wait
+
+            while rows < self.max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._next_item(remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                if rows + len(item[0]) > self.max_rows:
+                    # Keep it for the next batch rather than overshooting the limit
+                    self._pending = item
+                    break
+                batch.append(item)
+                rows += len(item[0])
+
+            self._flush(batch)
+
+        if self._pending is not None:
+            self._flush([self._pending])
+            self._pending = None
+
+    def _flush(self, batch: list[tuple[np.ndarray, Future]]) -> None:
+        live = [(tiles, fut) for tiles, fut in batch if fut.set_running_or_notify_cancel()]
+        if not live:
+            return
+        try:
+            stacked = live[0][0] if len(live) == 1 else np.concatenate([t for t, _ in live])
+            start = time.perf_counter()
+            predictions = np.asarray(self.predict_fn(stacked))
+            if self.on_batch is not None:
+                self.on_batch(len(stacked) / TILES_PER_BOARD, time.perf_counter() - start)
+        except Exception as e:
+            logger.exception("Batched inference failed for %d boards", len(live))
+            for _, fut in live:
+                fut.set_exception(e)
+            return
+
+        offset = 0
+        for tiles, fut in live:
+            fut.set_result(predictions[offset:offset + len(tiles)])
+            offset += len(tiles)
@@ -0,0 +1,111 @@
+"""
+Inference Backend Benchmark
+
+Compares the keras (TensorFlow) and onnx (ONNX Runtime) backends on:
+- startup: time to import the inference stack and load the model
+- memory: peak RSS of a process that has loaded the model and run it
+- latency: median InferenceRunner call time at the sizes the server uses
+- agreement: max output difference and predicted-class mismatches vs keras
+
+Each backend runs in its own subprocess so imports and memory are measured
+from a clean interpreter. Run export_onnx.py first to create the ONNX model.
+
+Usage:
+    python benchmarks/bench_backends.py [--repeat 50] [--max-boards 8]
+"""
+
+import argparse
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def child(backend: str, repeat: int, max_boards: int, out_path: str) -> None:
+    """Measure one backend in this process and write the results as JSON."""
+    start = time.perf_counter()
+    import numpy as np
+    from fen_generator import SQUARE_SIZE, TILES_PER_BOARD, InferenceRunner, batch_buckets, load_model
+    if backend == 'keras':
+        import tensorflow  # noqa: F401  (count the import in the startup time, as the server does)
+    else:
+        import onnxruntime  # noqa: F401
+    imported = time.perf_counter()
+    model = load_model(backend=backend)
+    loaded = time.perf_counter()
+    runner = InferenceRunner(model, batch_buckets(max_boards))
+    ready = time.perf_counter()
+
+    rng = np.random.default_rng(0)
+    check = rng.random((TILES_PER_BOARD * 2, SQUARE_SIZE, SQUARE_SIZE, 3), dtype=np.float32)
+    np.save(out_path + ".npy", runner(check))
+
+    latency = {}
+    for tiles in [16] + [boards * TILES_PER_BOARD for boards in (1, max_boards)]:
+        batch = rng.random((tiles, SQUARE_SIZE, SQUARE_SIZE, 3), dtype=np.float32)
+        runner(batch)
+        times = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            runner(batch)
+            times.append((time.perf_counter() - t) * 1000)
+        latency[tiles] = statistics.median(times)
+
+    with open(out_path, "w") as f:
+        json.dump({
+            'import_s': imported - start,
+            'load_s': loaded - imported,
+            'compile_s': ready - loaded,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'latency_ms': latency,
+        }, f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--max-boards", type=int, default=8, help="BATCH_MAX_SIZE of the server")
+    parser.add_argument("--child", choices=['keras', 'onnx'], help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.repeat, args.max_boards, args.out)
+        return
+
+    import numpy as np
+
+    results = {}
+    outputs = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in ('keras', 'onnx'):
+            out = str(Path(tmp) / backend)
+            subprocess.run([sys.executable, __file__, "--child", backend, "--out", out,
+                            "--repeat", str(args.repeat), "--max-boards", str(args.max_boards)],
+                           check=True, cwd=BACKEND_DIR)
+            with open(out) as f:
+                results[backend] = json.load(f)
+            outputs[backend] = np.load(out + ".npy")
+
+    sizes = list(results['keras']['latency_ms'])
+    print(f"{'backend':8s} {'import':>8s} {'load':>8s} {'compile':>8s} {'peak RSS':>10s} "
+          + " ".join(f"{size + ' tiles':>11s}" for size in sizes))
+    for backend, r in results.items():
+        print(f"{backend:8s} {r['import_s']:7.2f}s {r['load_s']:7.2f}s {r['compile_s']:7.2f}s "
+              f"{r['peak_rss_mb']:8.0f}MB "
+              + " ".join(f"{r['latency_ms'][size]:9.2f}ms" for size in sizes))
+
+    diff = float(np.abs(outputs['keras'] - outputs['onnx']).max())
+    mismatches = int((outputs['keras'].argmax(axis=1) != outputs['onnx'].argmax(axis=1)).sum())
+    print(f"\nonnx vs keras: max |diff| = {diff:.2e}, class mismatches = {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Cascade Inference Benchmark
+
+Runs the full ensemble and the confidence-gated cascade (CascadeRunner) at
+several thresholds on Kaggle test-set boards, and reports for each:
+- board and square accuracy
+- fraction of tiles escalated to the remaining folds
+- median time per board when called with micro-batches of --boards-per-call
+- boards whose FEN differs from the full ensemble's
+
+Real boards are needed: random tiles are uncertain for every fold and
+would all be escalated.
+
+Usage:
+    python benchmarks/bench_cascade.py [--thresholds 0.9 0.99 0.999] [--boards 1000]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from evaluation import DEFAULT_TEST_DIR, evaluate, list_boards, load_tiles  # noqa: E402
+from fen_generator import TILES_PER_BOARD, CascadeRunner, InferenceRunner, batch_buckets, load_model  # noqa: E402
+
+
+def time_per_board(runner, tiles: np.ndarray, boards_per_call: int) -> float:
+    """Median milliseconds per board over calls of boards_per_call boards."""
+    step = boards_per_call * TILES_PER_BOARD
+    runner(tiles[:step])
+    times = []
+    for start in range(0, len(tiles) - step + 1, step):
+        t = time.perf_counter()
+        runner(tiles[start:start + step])
+        times.append((time.perf_counter() - t) * 1000 / boards_per_call)
+    return statistics.median(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", type=Path, default=DEFAULT_TEST_DIR)
+    parser.add_argument("--boards", type=int, default=1000, help="Test boards to evaluate")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.9, 0.99, 0.999])
+    parser.add_argument("--boards-per-call", type=int, default=8)
+    parser.add_argument("--timing-boards", type=int, default=256, help="Boards used for the latency measurement")
+    args = parser.parse_args()
+
+    paths = list_boards(args.data)[:args.boards]
+    timing_tiles = load_tiles(paths[:args.timing_boards])
+    model = load_model()
+    buckets = batch_buckets(args.boards_per_call)
+
+    full = InferenceRunner(model, buckets)
+    reference = full(timing_tiles).argmax(axis=1)
+    baseline = evaluate(full, paths)
+    baseline_ms = time_per_board(full, timing_tiles, args.boards_per_call)
+
+    print(f"{'threshold':>9s} {'board acc':>10s} {'square acc':>11s} {'escalated':>10s} "
+          f"{'ms/board':>9s} {'speedup':>8s} {'boards != ensemble':>19s}")
+    print(f"{'ensemble':>9s} {baseline['board_accuracy']:10.4%} {baseline['square_accuracy']:11.5%} "
+          f"{1:10.2%} {baseline_ms:9.3f} {1:7.1f}x {0:19d}")
+    for threshold in args.thresholds:
+        cascade = CascadeRunner(model, threshold, buckets)
+        result = evaluate(cascade, paths)
+        escalated = cascade.stats()['escalated_fraction']
+        changed = (cascade(timing_tiles).argmax(axis=1) != reference).reshape(-1, TILES_PER_BOARD).any(axis=1)
+        ms = time_per_board(cascade, timing_tiles, args.boards_per_call)
+        print(f"{threshold:9g} {result['board_accuracy']:10.4%} {result['square_accuracy']:11.5%} "
+              f"{escalated:10.2%} {ms:9.3f} {baseline_ms / ms:7.1f}x {int(changed.sum()):19d}")
+
+
+if __name__ == "__main__":
+    main()
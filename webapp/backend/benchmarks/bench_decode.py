@@ -0,0 +1,97 @@
+"""
+Decode Backend Benchmark
+
+Compares image decode backends (PIL vs cv2.imdecode, full vs reduced
+resolution) on a set of screenshots, and checks that the FEN detected from
+each decode is identical to the FEN from a full-resolution PIL decode.
+
+Usage:
+    python benchmarks/bench_decode.py screenshots/*.png [--repeat 20] [--max-side 2048] [--no-fen]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from image_io import decode_image  # noqa: E402
+
+MAX_PIXELS = 10 ** 9  # benchmark: no budget
+
+
+def time_decode(data: bytes, backend: str, max_side: int | None, repeat: int) -> float:
+    """Median decode time in milliseconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decode_image(data, MAX_PIXELS, backend=backend, max_side=max_side)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="+", type=Path)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--max-side", type=int, default=2048,
+                        help="Reduced decode keeps the longer side at least this long")
+    parser.add_argument("--no-fen", action="store_true", help="Skip the FEN equality check (no model needed)")
+    args = parser.parse_args()
+
+    configs = [
+        ("pil", "pil", None),
+        ("pil-reduced", "pil", args.max_side),
+        ("cv2", "cv2", None),
+        ("cv2-reduced", "cv2", args.max_side),
+    ]
+
+    model = None
+    if not args.no_fen:
+        from board_detection import detect_board
+        from fen_generator import load_model, predict_fen
+        model = load_model()
+
+    totals = {name: 0.0 for name, _, _ in configs}
+    mismatches = 0
+
+    print(f"{'image':40s} {'size':>11s} " + " ".join(f"{name:>12s}" for name, _, _ in configs))
+    for path in args.images:
+        data = path.read_bytes()
+        reference_fen = None
+        row = []
+        size = ""
+        for name, backend, max_side in configs:
+            ms = time_decode(data, backend, max_side, args.repeat)
+            totals[name] += ms
+            image, factor = decode_image(data, MAX_PIXELS, backend=backend, max_side=max_side)
+            if not size:
+                size = f"{image.shape[1]}x{image.shape[0]}"
+            cell = f"{ms:7.1f}ms"
+            if factor > 1:
+                cell += f"/{factor}"
+
+            if model is not None:
+                cropped, _, success = detect_board(image)
+                fen = predict_fen(model, cropped)['fen'] if success else None
+                if reference_fen is None and name == "pil":
+                    reference_fen = fen
+                elif fen != reference_fen:
+                    mismatches += 1
+                    cell += "!"
+            row.append(f"{cell:>12s}")
+        print(f"{path.name[:40]:40s} {size:>11s} " + " ".join(row))
+
+    n = len(args.images)
+    print(f"{'mean':40s} {'':>11s} " + " ".join(f"{totals[name] / n:10.1f}ms" for name, _, _ in configs))
+    if model is not None:
+        print(f"\nFEN mismatches vs full-resolution PIL decode: {mismatches}"
+              + ("" if mismatches == 0 else "  (marked with !)"))
+        if mismatches:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
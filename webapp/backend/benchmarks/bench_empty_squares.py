@@ -0,0 +1,98 @@
+"""
+Empty-Square Fast Path Evaluation
+
+Runs the empty-square pre-classifier (empty_squares.py) over Kaggle
+test-set boards and reports:
+- skip rate: share of all tiles that would not reach the model
+- recall: share of the truly empty tiles that are skipped
+- false-skip rate: share of skipped tiles that actually hold a piece, and
+  the number of boards misread because of them
+- with --model: board accuracy and per-board time of the model alone and
+  of filter + model on the remaining tiles
+
+Run it with the thresholds you intend to serve (EMPTY_SKIP_MAX_*) before
+setting EMPTY_SKIP=1.
+
+Usage:
+    python benchmarks/bench_empty_squares.py [--boards 5000] [--max-std 0.02] [--model]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from empty_squares import EMPTY_CLASS, empty_square_mask, merge_predictions  # noqa: E402
+from evaluation import (  # noqa: E402
+    DEFAULT_TEST_DIR, fen_from_filename, labels_from_fen, list_boards, load_tiles,
+)
+from fen_generator import TILES_PER_BOARD, InferenceRunner, batch_buckets, load_model  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", type=Path, default=DEFAULT_TEST_DIR)
+    parser.add_argument("--boards", type=int, default=5000)
+    parser.add_argument("--max-std", type=float, default=0.02)
+    parser.add_argument("--max-edge", type=float, default=0.01)
+    parser.add_argument("--max-color", type=float, default=0.06)
+    parser.add_argument("--model", action="store_true", help="Also measure accuracy and time with the model")
+    args = parser.parse_args()
+
+    runner = InferenceRunner(load_model(), batch_buckets(1)) if args.model else None
+    tiles_total = skipped = empty_total = empty_skipped = 0
+    false_skips = 0
+    boards_hit = 0
+    correct = {'model': 0, 'filtered': 0}
+    times = {'model': [], 'filtered': []}
+    filter_times = []
+
+    for path in list_boards(args.data)[:args.boards]:
+        tiles = load_tiles([path])
+        labels = labels_from_fen(fen_from_filename(path))
+
+        start = time.perf_counter()
+        empty = empty_square_mask(tiles, max_std=args.max_std, max_edge=args.max_edge,
+                                  max_color_distance=args.max_color)
+        filter_times.append((time.perf_counter() - start) * 1000)
+
+        is_empty = labels == EMPTY_CLASS
+        wrong = empty & ~is_empty
+        tiles_total += TILES_PER_BOARD
+        skipped += int(empty.sum())
+        empty_total += int(is_empty.sum())
+        empty_skipped += int((empty & is_empty).sum())
+        false_skips += int(wrong.sum())
+        boards_hit += bool(wrong.any())
+
+        if runner is not None:
+            start = time.perf_counter()
+            full = runner(tiles)
+            times['model'].append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            rest = runner(tiles[~empty]) if not empty.all() else None
+            filtered = merge_predictions(empty, rest)
+            times['filtered'].append((time.perf_counter() - start) * 1000 + filter_times[-1])
+
+            correct['model'] += bool((full.argmax(axis=1) == labels).all())
+            correct['filtered'] += bool((filtered.argmax(axis=1) == labels).all())
+
+    boards = len(filter_times)
+    print(f"Boards: {boards}, tiles: {tiles_total}")
+    print(f"Skip rate:        {skipped / tiles_total:.2%} of all tiles "
+          f"({skipped / boards:.1f} per board, filter {statistics.median(filter_times):.2f} ms/board)")
+    print(f"Empty recall:     {empty_skipped / max(1, empty_total):.2%} of empty tiles skipped")
+    print(f"False-skip rate:  {false_skips / max(1, skipped):.4%} of skipped tiles "
+          f"({false_skips} tiles, {boards_hit} boards misread because of them)")
+    if runner is not None:
+        for name in ('model', 'filtered'):
+            print(f"{name:9s} board accuracy {correct[name] / boards:.4%}, "
+                  f"{statistics.median(times[name]):.2f} ms/board")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Inference Path Benchmark
+
+Compares model.predict() with the compiled fixed-signature InferenceRunner
+at the input sizes the server produces (partial boards from live tracking
+and whole micro-batches), and checks that both give the same output.
+
+Usage:
+    python benchmarks/bench_inference.py [--repeat 50] [--max-boards 8]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fen_generator import (  # noqa: E402
+    SQUARE_SIZE, TILES_PER_BOARD, InferenceRunner, batch_buckets, load_model,
+)
+
+
+def time_call(fn, tiles: np.ndarray, repeat: int) -> float:
+    """Median call time in milliseconds (after one untimed call)."""
+    fn(tiles)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(tiles)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--max-boards", type=int, default=8, help="BATCH_MAX_SIZE of the server")
+    args = parser.parse_args()
+
+    model = load_model()
+    start = time.perf_counter()
+    runner = InferenceRunner(model, batch_buckets(args.max_boards))
+    print(f"Compiled buckets {runner.buckets} in {time.perf_counter() - start:.2f} s\n")
+
+    rng = np.random.default_rng(0)
+    sizes = [1, 16] + [boards * TILES_PER_BOARD for boards in (1, 2, 3, args.max_boards)]
+
+    print(f"{'tiles':>6s} {'boards':>7s} {'predict':>10s} {'runner':>10s} {'speedup':>8s} {'max |diff|':>11s}")
+    for n in sorted(set(sizes)):
+        tiles = rng.random((n, SQUARE_SIZE, SQUARE_SIZE, 3), dtype=np.float32)
+        predict_ms = time_call(lambda x: model.predict(x, verbose=0), tiles, args.repeat)
+        runner_ms = time_call(runner, tiles, args.repeat)
+        diff = float(np.abs(model.predict(tiles, verbose=0) - runner(tiles)).max())
+        print(f"{n:6d} {n / TILES_PER_BOARD:7.2f} {predict_ms:8.2f}ms {runner_ms:8.2f}ms "
+              f"{predict_ms / runner_ms:7.1f}x {diff:11.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,8 @@ Pipeline:
 7. Crop exactly to board edges
 """
 
+import time
+
 import numpy as np
 import cv2
 from skimage import io
@@ -250,12 +252,16 @@ def get_chess_lines(hdx: np.ndarray, hdy: np.ndarray, hdx_thresh: float,
     return lines_x, lines_y, is_match
 
 
-def detect_board(image: np.ndarray) -> tuple[np.ndarray, tuple[int, int, int, int], bool]:
+def detect_board(image: np.ndarray, timings: dict | None = None) -> tuple[np.ndarray, tuple[int, int, int, int], bool]:
     """
     Detect chessboard via gradient projection with pos/neg product.
 
     Args:
         image: RGB image as numpy array
+        timings: Optional dict to fill with per-stage measurements:
+            rough_crop, sobel, line_search (seconds), threshold_levels
+            (adaptive threshold levels tried), refined (whether the
+            refinement pass ran) and crop_found
 
     Returns:
         cropped: The cropped board image (RGB)
@@ -265,9 +271,11 @@ def detect_board(image: np.ndarray) -> tuple[np.ndarray, tuple[int, int, int, in
     if image.ndim == 3 and image.shape[2] == 4:
         image = image[:, :, :3]
     h_orig, w_orig = image.shape[:2]
+    t_start = time.perf_counter()
 
     # Rough crop to isolate board region
     cropped_rough, (y_off, x_off), crop_found = rough_crop_board(image)
+    t_crop = time.perf_counter()
     if crop_found:
         working_image = cropped_rough
     else:
@@ -296,9 +304,11 @@ def detect_board(image: np.ndarray) -> tuple[np.ndarray, tuple[int, int, int, in
     # Hough-like projection: multiply positive and negative sums
     hough_Dx = (np.sum(Dx_pos, axis=0) * np.sum(Dx_neg, axis=0)) / (h ** 2)
     hough_Dy = (np.sum(Dy_pos, axis=1) * np.sum(Dy_neg, axis=1)) / (w ** 2)
+    t_sobel = time.perf_counter()
 
     # Adaptive threshold loop
     is_match = False
+    refined = False
     lines_x = []
     lines_y = []
     a = 1
@@ -314,6 +324,7 @@ def detect_board(image: np.ndarray) -> tuple[np.ndarray, tuple[int, int, int, in
         if is_match:
             # Refinement: try next threshold level
             if a < 4:
+                refined = True
                 next_thresh_x = np.max(hough_Dx) * ((a + 1) / 5.0)
                 next_thresh_y = np.max(hough_Dy) * ((a + 1) / 5.0)
                 next_lx, next_ly, next_match = get_chess_lines(
@@ -324,6 +335,16 @@ def detect_board(image: np.ndarray) -> tuple[np.ndarray, tuple[int, int, int, in
             break
         a += 1
 
+    if timings is not None:
+        timings.update({
+            'rough_crop': t_crop - t_start,
+            'sobel': t_sobel - t_crop,
+            'line_search': time.perf_counter() - t_sobel,
+            'threshold_levels': min(a, 4),
+            'refined': refined,
+            'crop_found': crop_found,
+        })
+
     if not is_match:
         # Return full image if detection failed
         return working_image, (y_off, h + y_off, x_off, w + x_off), False
@@ -488,7 +509,8 @@ def detect_board_from_file(image_path: str) -> tuple[np.ndarray, tuple[int, int,
 
 
 def draw_bbox_on_image(image: np.ndarray, bbox: tuple[int, int, int, int],
-                       color: tuple = (0, 255, 0), thickness: int = 3) -> np.ndarray:
+                       color: tuple = (0, 255, 0), thickness: int = 3,
+                       max_width: int | None = None) -> np.ndarray:
     """Draw bounding box on image.
 
     Args:
@@ -496,13 +518,21 @@ def draw_bbox_on_image(image: np.ndarray, bbox: tuple[int, int, int, int],
         bbox: (y0, y1, x0, x1)
         color: BGR color tuple
         thickness: Line thickness
+        max_width: If set, downscale the image to at most this width first
+            (bbox is scaled to match)
 
     Returns:
-        Image with bbox drawn
+        Image with bbox drawn (RGB)
     """
     y0, y1, x0, x1 = bbox
-    annotated = image.copy()
-    # Convert RGB to BGR for OpenCV, draw rectangle, convert back
-    annotated_bgr = cv2.cvtColor(annotated, cv2.COLOR_RGB2BGR)
-    cv2.rectangle(annotated_bgr, (x0, y0), (x1, y1), color, thickness)
-    return cv2.cvtColor(annotated_bgr, cv2.COLOR_BGR2RGB)
+    h, w = image.shape[:2]
+    if max_width is not None and w > max_width:
+        scale = max_width / w
+        annotated = cv2.resize(image, (max_width, max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        y0, y1, x0, x1 = (int(round(v * scale)) for v in (y0, y1, x0, x1))
+    else:
+        annotated = image.copy()
+    # Draw straight onto the RGB image with the color reversed, instead of
+    # converting the whole image to BGR and back
+    cv2.rectangle(annotated, (x0, y0), (x1, y1), tuple(reversed(color)), thickness)
+    return annotated
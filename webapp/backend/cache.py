@@ -0,0 +1,347 @@
+"""
+Prediction Caches
+
+Users re-upload the same screenshot through retries, shares and refreshes.
+Results are cached by a hash of the uploaded bytes plus the request
+parameters, in two tiers:
+- an in-process LRU bounded by total size and entry age
+- an optional on-disk tier (one JSON file per key) that every worker process
+  on the host can read, bounded by total size and entry age
+
+Screenshots of the same position that differ outside the board (browser
+chrome, clocks, sidebars) miss that cache, so a second index matches the
+detected board crop itself by a small perceptual signature and reuses the
+stored classification.
+
+Identical uploads that arrive while the first is still being processed are
+not in either cache yet; SingleFlight makes them wait for that first
+computation instead of starting their own.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(data: bytes, *params: str) -> str:
+    """Build a cache key from content bytes and the parameters that affect the result."""
+    digest = hashlib.sha256(data)
+    for param in params:
+        digest.update(b"\0" + param.encode())
+    return digest.hexdigest()
+
+
+def file_digest(path: str | Path) -> str:
+    """SHA-256 of a file's contents, read in chunks (e.g. model weights for cache keys)."""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+class ResultCache:
+    """Two-tier (memory LRU + optional disk) cache of JSON-serializable results.
+
+    Args:
+        max_bytes: Memory tier budget in bytes (0 disables the memory tier)
+        ttl_seconds: Maximum age of an entry in either tier
+        disk_dir: Directory for the shared disk tier (None disables it)
+        disk_max_bytes: Disk tier budget in bytes
+    """
+
+    # Prune the disk tier every this many writes rather than on each one
+    DISK_PRUNE_INTERVAL = 64
+
+    def __init__(self, max_bytes: int, ttl_seconds: float, disk_dir: str | Path | None = None,
+                 disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: OrderedDict[str, tuple[float, int, dict]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 or self.disk_dir is not None
+
+    def get(self, key: str) -> dict | None:
+        """Return the cached value for key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, _, value = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._evict(key)
+
+        value = self._read_disk(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+        self._put_memory(key, value, now)
+        return value
+
+    def put(self, key: str, value: dict) -> None:
+        """Store value under key in every enabled tier."""
+        now = time.time()
+        payload = json.dumps(value, separators=(",", ":")).encode()
+        self._put_memory(key, value, now, len(payload))
+        self._write_disk(key, payload)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and memory tier occupancy."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._size,
+            }
+
+    # --- Memory tier ---
+
+    def _evict(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+    def _put_memory(self, key: str, value: dict, now: float, size: int | None = None) -> None:
+        if self.max_bytes <= 0:
+            return
+        if size is None:
+            size = len(json.dumps(value, separators=(",", ":")))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = (now, size, value)
+            self._size += size
+            while self._size > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+
+    # --- Disk tier ---
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _read_disk(self, key: str, now: float) -> dict | None:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            if now - path.stat().st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                return None
+            return json.loads(path.read_bytes())
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: str, payload: bytes) -> None:
+        if self.disk_dir is None or len(payload) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(exist_ok=True)
+            # Write then rename, so other workers never read a partial file
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp, path)
+        except OSError:
+            logger.warning("Failed to write cache entry %s", key, exc_info=True)
+            return
+
+        with self._lock:
+            self._disk_writes += 1
+            should_prune = self._disk_writes % self.DISK_PRUNE_INTERVAL == 0
+        if should_prune:
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """Delete expired entries, then the oldest ones until under the size budget."""
+        now = time.time()
+        files = []
+        for path in self.disk_dir.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            if now - st.st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+            else:
+                files.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution.
+
+    The first caller's coroutine runs as its own task, so it finishes (and
+    its waiters get the result) even if that caller disconnects. Results and
+    exceptions are shared by every caller of the key. Use from the event
+    loop only.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """Await fn() for key, or the call already in flight for it.
+
+        Returns:
+            (result, shared) where shared is True if another caller's computation was reused
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        # shield(): one caller being cancelled must not cancel the shared task
+        return await asyncio.shield(task), shared
+
+    def running(self, key: str) -> bool:
+        """Whether a call for key is in flight, i.e. run() would join it."""
+        return key in self._calls
+
+    def _finished(self, key: str, task: asyncio.Task) -> None:
+        self._calls.pop(key, None)
+        # Mark the exception retrieved: if every caller went away, nobody else will
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': len(self._calls),
+            'computed': self.leaders,
+            'coalesced': self.coalesced,
+        }
+
+
+SIGNATURE_SIZE = 64  # 8x8 signature pixels per square
+
+
+def board_signature(board_image: np.ndarray) -> np.ndarray:
+    """Compact perceptual signature of a cropped board: a 64x64 grayscale thumbnail."""
+    gray = cv2.cvtColor(board_image, cv2.COLOR_RGB2GRAY) if board_image.ndim == 3 else board_image
+    return cv2.resize(gray, (SIGNATURE_SIZE, SIGNATURE_SIZE), interpolation=cv2.INTER_AREA)
+
+
+def _tile_view(signatures: np.ndarray) -> np.ndarray:
+    """Reshape (..., 64, 64) signatures into (..., 8, 8, 8, 8) = rank, file, pixel rows, pixel cols."""
+    step = SIGNATURE_SIZE // 8
+    return signatures.reshape(signatures.shape[:-2] + (8, step, 8, step)).swapaxes(-3, -2)
+
+
+class BoardSignatureIndex:
+    """Near-duplicate lookup of board crops to their model predictions.
+
+    Two boards match when every one of their 64 squares differs by at most
+    `threshold` grey levels on average, so a single moved piece (which
+    changes two squares a lot) never matches, while re-encoding noise and
+    small scaling differences do. On a synthetic 320px board, moving a small
+    disc one square scores 16 grey levels, JPEG re-encoding 0.1 and
+    rescaling to 300px 1.8 (tests/test_board_signature.py).
+
+    Args:
+        max_entries: Number of boards remembered, oldest replaced first (0 disables)
+        threshold: Maximum mean absolute difference per square, in grey levels (0-255)
+    """
+
+    def __init__(self, max_entries: int, threshold: float):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._signatures = np.zeros((max(0, max_entries), SIGNATURE_SIZE, SIGNATURE_SIZE), np.uint8)
+        self._tile_means = np.zeros((max(0, max_entries), 8, 8), np.float32)
+        self._predictions: list[np.ndarray | None] = [None] * max(0, max_entries)
+        self._count = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def lookup(self, signature: np.ndarray) -> np.ndarray | None:
+        """Return the stored predictions of a matching board, or None."""
+        tile_means = _tile_view(signature).mean(axis=(-2, -1))
+        with self._lock:
+            n = self._count
+            # Cheap prefilter: per-square mean brightness can differ by no more
+            # than the mean absolute difference, so compare those first
+            coarse = np.abs(self._tile_means[:n] - tile_means).max(axis=(1, 2))
+            candidates = np.nonzero(coarse <= self.threshold)[0]
+            if len(candidates):
+                diffs = np.abs(self._signatures[candidates].astype(np.int16) - signature.astype(np.int16))
+                scores = _tile_view(diffs).mean(axis=(-2, -1)).max(axis=(1, 2))
+                best = int(np.argmin(scores))
+                if scores[best] <= self.threshold:
+                    self.hits += 1
+                    return self._predictions[candidates[best]]
+            self.misses += 1
+            return None
+
+    def add(self, signature: np.ndarray, predictions: np.ndarray) -> None:
+        """Remember the predictions for a board signature."""
+        if not self.enabled:
+            return
+        with self._lock:
+            slot = self._next
+            self._signatures[slot] = signature
+            self._tile_means[slot] = _tile_view(signature).mean(axis=(-2, -1))
+            self._predictions[slot] = predictions
+            self._next = (slot + 1) % self.max_entries
+            self._count = min(self._count + 1, self.max_entries)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and occupancy."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': self._count,
+                'threshold': self.threshold,
+            }
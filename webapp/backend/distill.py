@@ -0,0 +1,185 @@
+"""
+Distill the Ensemble into a Single Student Model
+
+The served ensemble sums three fold networks, so every tile runs through
+three CNNs. This tool trains one network of the same architecture as a
+fold (see get_model() in train_chess_model.ipynb) to reproduce the
+ensemble's output:
+1. The ensemble labels the training boards once; its output, normalized to
+   a distribution, is the soft target of every tile
+2. The student trains on a blend of those soft targets and the true labels
+   from the file names (--alpha is the weight of the true labels)
+3. The best checkpoint (lowest validation loss) is scored on the Kaggle test
+   set next to the ensemble, for board accuracy and per-board latency
+4. It is published only if its board accuracy reaches --min-board-accuracy
+
+The student is a plain Keras model, so load_model() serves it in place of
+the ensemble:
+    MODEL_PATH=models/student_medium.keras python serve.py
+and export_onnx.py / quantize.py accept it through --model.
+
+Usage:
+    python distill.py [--train-data ../../data/train] [--train-boards 20000] [--epochs 40]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from math import ceil
+from pathlib import Path
+
+import keras
+import numpy as np
+
+from evaluation import (
+    DEFAULT_TEST_DIR, evaluate, fen_from_filename, labels_from_fen, latency_per_board, list_boards, load_tiles,
+)
+from fen_generator import (
+    DEFAULT_MODEL_PATH, SQUARE_SIZE, TILES_PER_BOARD, InferenceRunner, batch_buckets, load_model,
+)
+
+DEFAULT_STUDENT_PATH = DEFAULT_MODEL_PATH.parent / 'student_medium.keras'
+DEFAULT_TRAIN_DIR = DEFAULT_TEST_DIR.parent / 'train'
+SEED = 2019
+
+
+def get_student(image_size: int = SQUARE_SIZE) -> keras.Model:
+    """One fold network of the training notebook, trained on soft targets."""
+    model = keras.models.Sequential([
+        keras.Input(shape=(image_size, image_size, 3)),
+        keras.layers.Conv2D(32, (3, 3), activation='relu', kernel_initializer='he_normal'),
+        keras.layers.Dropout(0.2),
+        keras.layers.Conv2D(32, (3, 3), activation='relu', kernel_initializer='he_normal'),
+        keras.layers.Dropout(0.2),
+        keras.layers.MaxPooling2D(pool_size=(2, 2), padding='same'),
+        keras.layers.Conv2D(32, (3, 3), activation='relu', kernel_initializer='he_normal'),
+        keras.layers.Dropout(0.2),
+        keras.layers.Conv2D(32, (3, 3), activation='relu', kernel_initializer='he_normal'),
+        keras.layers.Dropout(0.2),
+        keras.layers.Flatten(),
+        keras.layers.Dense(128, activation='relu', kernel_initializer='he_normal'),
+        keras.layers.Dropout(0.2),
+        keras.layers.Dense(13, activation='softmax', kernel_initializer='lecun_normal'),
+    ])
+    # Cross-entropy against soft targets; minimizing it minimizes the KL
+    # divergence from the ensemble's distribution
+    model.compile(optimizer=keras.optimizers.Adam(), loss='categorical_crossentropy', metrics=['accuracy'])
+    return model
+
+
+def soft_targets(teacher: InferenceRunner, paths: list[Path], chunk_boards: int = 256) -> np.ndarray:
+    """Ensemble output for every tile of the boards, normalized to sum to 1; shape (boards, 64, 13)."""
+    targets = np.empty((len(paths), TILES_PER_BOARD, 13), dtype=np.float32)
+    for start in range(0, len(paths), chunk_boards):
+        chunk = paths[start:start + chunk_boards]
+        scores = teacher(load_tiles(chunk))
+        scores = scores / scores.sum(axis=1, keepdims=True)
+        targets[start:start + len(chunk)] = scores.reshape(len(chunk), TILES_PER_BOARD, 13)
+        print(f"  labelled {start + len(chunk)}/{len(paths)} boards", end="\r")
+    print()
+    return targets
+
+
+class BoardSequence(keras.utils.PyDataset):
+    """Batches of (tiles, blended targets) for whole boards, reshuffled every epoch."""
+
+    def __init__(self, paths: list[Path], targets: np.ndarray, batch_boards: int, alpha: float,
+                 shuffle: bool = True, **kwargs):
+        super().__init__(**kwargs)
+        self.paths = paths
+        self.batch_boards = batch_boards
+        self.shuffle = shuffle
+        hard = np.stack([np.eye(13, dtype=np.float32)[labels_from_fen(fen_from_filename(p))] for p in paths])
+        self.targets = alpha * hard + (1 - alpha) * targets
+        self.order = np.arange(len(paths))
+        self._rng = np.random.default_rng(SEED)
+        self.on_epoch_end()
+
+    def __len__(self) -> int:
+        return ceil(len(self.paths) / self.batch_boards)
+
+    def __getitem__(self, index: int) -> tuple[np.ndarray, np.ndarray]:
+        boards = self.order[index * self.batch_boards:(index + 1) * self.batch_boards]
+        tiles = load_tiles([self.paths[i] for i in boards])
+        return tiles, self.targets[boards].reshape(-1, 13)
+
+    def on_epoch_end(self) -> None:
+        if self.shuffle:
+            self._rng.shuffle(self.order)
+
+
+def get_callbacks(checkpoint: Path, patience: int) -> list:
+    """Early stopping, LR reduction and best-model checkpointing, as in the training notebook."""
+    return [
+        keras.callbacks.EarlyStopping(monitor='val_loss', patience=patience, mode='min', verbose=1),
+        keras.callbacks.ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=patience // 2,
+                                          min_lr=0.000001, mode='min', verbose=1),
+        keras.callbacks.ModelCheckpoint(filepath=str(checkpoint), monitor='val_loss', save_best_only=True,
+                                        mode='min', verbose=1),
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--teacher", type=Path, default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--out", type=Path, default=DEFAULT_STUDENT_PATH)
+    parser.add_argument("--train-data", type=Path, default=DEFAULT_TRAIN_DIR)
+    parser.add_argument("--test-data", type=Path, default=DEFAULT_TEST_DIR)
+    parser.add_argument("--train-boards", type=int, default=20000)
+    parser.add_argument("--test-boards", type=int, default=5000)
+    parser.add_argument("--validation-split", type=float, default=0.1)
+    parser.add_argument("--batch-boards", type=int, default=64, help="Boards (x64 tiles) per training step")
+    parser.add_argument("--epochs", type=int, default=40)
+    parser.add_argument("--patience", type=int, default=8)
+    parser.add_argument("--alpha", type=float, default=0.1, help="Weight of the true labels vs the soft targets")
+    parser.add_argument("--min-board-accuracy", type=float, default=0.995,
+                        help="Lowest student board accuracy that may be published")
+    parser.add_argument("--workers", type=int, default=4, help="Threads loading training boards")
+    args = parser.parse_args()
+
+    keras.utils.set_random_seed(SEED)
+    boards = list_boards(args.train_data, seed=SEED)[:args.train_boards]
+    n_valid = max(1, int(len(boards) * args.validation_split))
+    train, valid = boards[n_valid:], boards[:n_valid]
+    test = list_boards(args.test_data)[:args.test_boards]
+
+    teacher = InferenceRunner(load_model(args.teacher), batch_buckets(8))
+    print(f"Labelling {len(boards)} training boards with the ensemble...")
+    targets = soft_targets(teacher, boards)
+
+    student = get_student()
+    with tempfile.TemporaryDirectory(dir=args.out.parent) as tmp:
+        checkpoint = Path(tmp) / 'student.keras'
+        student.fit(
+            BoardSequence(train, targets[n_valid:], args.batch_boards, args.alpha,
+                          workers=args.workers, use_multiprocessing=False),
+            validation_data=BoardSequence(valid, targets[:n_valid], args.batch_boards, args.alpha,
+                                          shuffle=False, workers=args.workers),
+            epochs=args.epochs,
+            callbacks=get_callbacks(checkpoint, args.patience),
+            verbose=1,
+        )
+        student = InferenceRunner(load_model(checkpoint), batch_buckets(8))
+
+        print(f"\nEvaluating on {len(test)} test boards...\n")
+        print(f"{'model':9s} {'board acc':>10s} {'square acc':>11s} {'ms/board (1)':>13s} {'ms/board (8)':>13s}")
+        results = {}
+        for name, model in (('ensemble', teacher), ('student', student)):
+            results[name] = evaluate(model, test)
+            results[name]['latency'] = latency_per_board(model, 1)
+            print(f"{name:9s} {results[name]['board_accuracy']:10.4%} {results[name]['square_accuracy']:11.5%} "
+                  f"{results[name]['latency']:13.3f} {latency_per_board(model, 8):13.3f}")
+        print(f"\nStudent speedup: {results['ensemble']['latency'] / results['student']['latency']:.1f}x per board")
+
+        accuracy = results['student']['board_accuracy']
+        if accuracy < args.min_board_accuracy:
+            print(f"Student board accuracy {accuracy:.4%} is below {args.min_board_accuracy:.4%}; not publishing. "
+                  f"Misread boards: {results['student']['wrong_boards'][:10]}", file=sys.stderr)
+            sys.exit(1)
+        os.replace(checkpoint, args.out)
+    print(f"Published {args.out}")
+
+
+if __name__ == "__main__":
+    main()
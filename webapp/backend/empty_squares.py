@@ -0,0 +1,80 @@
+"""
+Empty-Square Fast Path
+
+Typically 40 or more of a board's 64 squares are empty, and an empty
+square is a flat patch of one of the board's two square colours. This
+pre-classifier marks such tiles as empty (class 12) from cheap per-tile
+statistics, so only the remaining tiles go through the CNN:
+1. Flatness: standard deviation and mean gradient (edge energy) of the
+   grey level, measured inside a margin so grid lines and slightly
+   misaligned crops do not count
+2. Colour: the tile's mean colour must match the board's colour for its
+   square parity, estimated as the median over that parity's flat tiles
+
+Pieces, highlighted squares, coordinates and textured (wood, marble)
+boards fail one of the tests and are left to the model, so the filter errs
+towards sending tiles to the model. benchmarks/bench_empty_squares.py
+measures its skip and false-skip rates on the Kaggle test set.
+"""
+
+import numpy as np
+
+from fen_generator import TILES_PER_BOARD
+
+EMPTY_CLASS = 12
+
+# Parity ((row + col) % 2) of each square, in model tile order (row by row)
+_PARITY = (np.add.outer(np.arange(8), np.arange(8)) % 2).ravel()
+
+
+def empty_square_mask(tiles: np.ndarray, max_std: float = 0.02, max_edge: float = 0.01,
+                      max_color_distance: float = 0.06, margin: int = 4) -> np.ndarray:
+    """Find the tiles of one board that are confidently empty.
+
+    Args:
+        tiles: The board's (64, 40, 40, 3) model input, values in [0, 1]
+        max_std: Largest grey-level standard deviation of an empty tile
+        max_edge: Largest mean absolute grey-level gradient of an empty tile
+        max_color_distance: Largest per-channel difference from the board's square colour
+        margin: Pixels ignored along each tile edge
+
+    Returns:
+        (64,) bool array, True for tiles that can skip the model
+    """
+    if len(tiles) != TILES_PER_BOARD:
+        raise ValueError(f"Expected the {TILES_PER_BOARD} tiles of one board, got {len(tiles)}")
+    inner = tiles[:, margin:-margin, margin:-margin] if margin else tiles
+    grey = inner.mean(axis=3)
+    edge = np.abs(np.diff(grey, axis=1)).mean(axis=(1, 2)) + np.abs(np.diff(grey, axis=2)).mean(axis=(1, 2))
+    flat = (grey.std(axis=(1, 2)) <= max_std) & (edge <= max_edge)
+
+    colors = inner.mean(axis=(1, 2))
+    empty = np.zeros(TILES_PER_BOARD, dtype=bool)
+    for parity in (0, 1):
+        candidates = flat & (_PARITY == parity)
+        if not candidates.any():
+            continue
+        reference = np.median(colors[candidates], axis=0)
+        empty |= candidates & (np.abs(colors - reference).max(axis=1) <= max_color_distance)
+    return empty
+
+
+def merge_predictions(empty: np.ndarray, predictions: np.ndarray | None) -> np.ndarray:
+    """Board predictions from the model's output for the non-empty tiles.
+
+    Skipped tiles get a one-hot empty score. predictions_to_fen() normalizes
+    each square's scores, so they read as empty with confidence 1.0
+    whatever the scale of the model's output.
+
+    Args:
+        empty: (64,) mask from empty_square_mask()
+        predictions: Model output for tiles[~empty], or None if every tile was skipped
+
+    Returns:
+        (64, 13) predictions for the whole board
+    """
+    merged = np.zeros((len(empty), EMPTY_CLASS + 1), dtype=np.float32)
+    merged[empty, EMPTY_CLASS] = 1.0
+    if predictions is not None:
+        merged[~empty] = predictions
+    return merged
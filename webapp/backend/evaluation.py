@@ -0,0 +1,108 @@
+"""
+Test-Set Evaluation Helpers
+
+The model tools (quantization, distillation, ...) measure a candidate model
+the same way test_chess_model.ipynb does: on the Kaggle Chess Positions test
+set, whose file names are the boards' FENs (ranks separated by dashes). A
+board counts as correct only if all 64 squares are.
+
+Images are tiled exactly like the training notebook's process_image(), so
+no board detection is involved.
+"""
+
+import random
+import statistics
+import time
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+from skimage import io
+
+from empty_squares import EMPTY_CLASS
+from fen_generator import PIECE_SYMBOLS, SQUARE_SIZE, TILES_PER_BOARD, process_board_for_model
+
+# Kaggle test set, as laid out by train_chess_model.ipynb (data/test/*.jpeg at the repo root)
+DEFAULT_TEST_DIR = Path(__file__).resolve().parents[2] / 'data' / 'test'
+
+
+def fen_from_filename(path: str | Path) -> str:
+    """Simplified FEN of a test image, e.g. '1b1B1b2-2pK2q1-...-8'."""
+    return Path(path).stem
+
+
+def labels_from_fen(fen: str) -> np.ndarray:
+    """Class index (0-12, 12 = empty) of each of the 64 squares of a simplified FEN."""
+    labels = []
+    for char in fen.replace('-', ''):
+        if char in '12345678':
+            labels.extend([EMPTY_CLASS] * int(char))
+        else:
+            labels.append(PIECE_SYMBOLS.index(char))
+    if len(labels) != TILES_PER_BOARD:
+        raise ValueError(f"FEN {fen!r} does not describe 64 squares")
+    return np.array(labels)
+
+
+def list_boards(directory: str | Path = DEFAULT_TEST_DIR, seed: int = 0) -> list[Path]:
+    """Test images in a fixed shuffled order, so disjoint slices are comparable across runs."""
+    directory = Path(directory)
+    if not directory.is_dir():
+        raise FileNotFoundError(f"Test set not found at: {directory} (see train_chess_model.ipynb)")
+    paths = sorted(directory.glob('*.jpeg'))
+    random.Random(seed).shuffle(paths)
+    return paths
+
+
+def load_tiles(paths: list[Path]) -> np.ndarray:
+    """Tiles of the given boards, shape (len(paths) * 64, 40, 40, 3), float32."""
+    tiles = np.empty((len(paths) * TILES_PER_BOARD, SQUARE_SIZE, SQUARE_SIZE, 3), dtype=np.float32)
+    for i, path in enumerate(paths):
+        tiles[i * TILES_PER_BOARD:(i + 1) * TILES_PER_BOARD] = process_board_for_model(io.imread(path)[..., :3])
+    return tiles
+
+
+def evaluate(predict: Callable[[np.ndarray], np.ndarray], paths: list[Path], batch_boards: int = 32) -> dict:
+    """Board- and square-level accuracy of a model on test images.
+
+    Args:
+        predict: Function mapping (N, 40, 40, 3) tiles to (N, 13) scores
+        paths: Test images
+        batch_boards: Boards loaded and predicted at a time
+
+    Returns:
+        Dictionary with boards, board_accuracy, square_accuracy and
+        wrong_boards (FENs of the misread boards)
+    """
+    correct_boards = 0
+    correct_squares = 0
+    wrong = []
+    for start in range(0, len(paths), batch_boards):
+        chunk = paths[start:start + batch_boards]
+        predicted = predict(load_tiles(chunk)).argmax(axis=1).reshape(len(chunk), TILES_PER_BOARD)
+        for path, board in zip(chunk, predicted):
+            hits = int((board == labels_from_fen(fen_from_filename(path))).sum())
+            correct_squares += hits
+            if hits == TILES_PER_BOARD:
+                correct_boards += 1
+            else:
+                wrong.append(fen_from_filename(path))
+    return {
+        'boards': len(paths),
+        'board_accuracy': correct_boards / max(1, len(paths)),
+        'square_accuracy': correct_squares / max(1, len(paths) * TILES_PER_BOARD),
+        'wrong_boards': wrong,
+    }
+
+
+def latency_per_board(predict: Callable[[np.ndarray], np.ndarray], boards: int = 1, repeat: int = 50) -> float:
+    """Median time in milliseconds per board when predicting `boards` boards at once."""
+    tiles = np.random.default_rng(0).random((boards * TILES_PER_BOARD, SQUARE_SIZE, SQUARE_SIZE, 3),
+                                            dtype=np.float32)
+    predict(tiles)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        predict(tiles)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times) / boards
@@ -0,0 +1,100 @@
+"""
+Export the Keras Ensemble to ONNX
+
+Converts models/ensemble_medium.keras into models/ensemble_medium.onnx for
+the onnx backend (MODEL_BACKEND=onnx), then checks that ONNX Runtime
+reproduces the Keras output on random tiles (and on tiles from board
+screenshots, if given) within tolerance and with the same predicted classes.
+The model is written to its destination only if that check passes.
+
+Needs TensorFlow, tf2onnx and onnxruntime; only the last is needed to serve.
+
+Usage:
+    python export_onnx.py [--out models/ensemble_medium.onnx] [--check screenshots/*.png]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from fen_generator import (
+    DEFAULT_MODEL_PATH, DEFAULT_ONNX_MODEL_PATH, SQUARE_SIZE, load_model, process_board_for_model,
+)
+
+OPSET = 17
+ATOL = 1e-4  # outputs are sums of 3 softmaxes, so in [0, 3]
+
+
+def export(keras_path: Path, onnx_path: Path) -> None:
+    """Convert the Keras model to ONNX with a dynamic batch dimension."""
+    import tensorflow as tf
+    import tf2onnx
+
+    model = load_model(keras_path)
+    # Convert a plain tf.function of the inference call, which avoids tf2onnx's
+    # Keras-version-specific model handling
+    spec = (tf.TensorSpec((None, SQUARE_SIZE, SQUARE_SIZE, 3), tf.float32, name="tiles"),)
+    call = tf.function(lambda tiles: model(tiles, training=False), input_signature=spec)
+    tf2onnx.convert.from_function(call, input_signature=spec, opset=OPSET, output_path=str(onnx_path))
+    print(f"Exported {onnx_path.stat().st_size / 1024:.0f} KB model")
+
+
+def check_tiles(images: list[Path]) -> np.ndarray:
+    """Random tiles plus the tiles of any board screenshots given."""
+    rng = np.random.default_rng(0)
+    batches = [rng.random((128, SQUARE_SIZE, SQUARE_SIZE, 3), dtype=np.float32)]
+    if images:
+        from board_detection import detect_board_from_file
+        for path in images:
+            cropped, _, success = detect_board_from_file(str(path))
+            if success:
+                batches.append(process_board_for_model(cropped).astype(np.float32))
+            else:
+                print(f"  {path.name}: no board detected, skipped")
+    return np.concatenate(batches)
+
+
+def verify(keras_path: Path, onnx_path: Path, images: list[Path]) -> bool:
+    """Compare Keras and ONNX Runtime outputs; True if they match."""
+    keras_model = load_model(keras_path)
+    onnx_model = load_model(onnx_path, backend='onnx')
+    tiles = check_tiles(images)
+
+    expected = keras_model.predict(tiles, verbose=0)
+    actual = onnx_model(tiles)
+    max_diff = float(np.abs(expected - actual).max())
+    class_mismatches = int((expected.argmax(axis=1) != actual.argmax(axis=1)).sum())
+    print(f"Checked {len(tiles)} tiles: max |diff| = {max_diff:.2e}, class mismatches = {class_mismatches}")
+    return max_diff <= ATOL and class_mismatches == 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", type=Path, default=DEFAULT_MODEL_PATH, help="Keras model to export")
+    parser.add_argument("--out", type=Path, default=DEFAULT_ONNX_MODEL_PATH)
+    parser.add_argument("--check", nargs="*", type=Path, default=[],
+                        help="Board screenshots whose tiles are added to the equivalence check")
+    args = parser.parse_args()
+
+    # Export next to the destination and rename only after verification, so a
+    # failed check never leaves an unverified model where the server loads it
+    fd, candidate = tempfile.mkstemp(dir=args.out.parent, suffix='.onnx')
+    os.close(fd)
+    candidate = Path(candidate)
+    try:
+        export(args.model, candidate)
+        if not verify(args.model, candidate, args.check):
+            print(f"ONNX output differs from Keras by more than {ATOL}; not publishing", file=sys.stderr)
+            sys.exit(1)
+        os.replace(candidate, args.out)
+    finally:
+        candidate.unlink(missing_ok=True)
+    print(f"ONNX model matches the Keras model; published {args.out}")
+
+
+if __name__ == "__main__":
+    main()
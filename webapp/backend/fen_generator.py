@@ -2,30 +2,49 @@
 FEN Generator Module
 
 Handles:
-- Model loading and inference
+- Model loading and inference (compiled fixed-size graphs, see InferenceRunner;
+  optionally a confidence-gated cascade over the folds, see CascadeRunner)
 - FEN notation conversion
 - Analysis link generation
+
+Two inference backends are available:
+- 'keras': the .keras ensemble run by TensorFlow
+- 'onnx': the same ensemble exported to ONNX by export_onnx.py and run by
+  ONNX Runtime on CPU
+
+TensorFlow is imported only when the keras backend is used, so a server
+running the onnx backend starts without it.
 """
 
+from __future__ import annotations
+
 import numpy as np
+import threading
 import urllib.parse
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable
 from skimage import transform
 from skimage.util.shape import view_as_blocks
 
-import keras
-import tensorflow as tf
+if TYPE_CHECKING:
+    import keras
 
 
 SQUARE_SIZE = 40
+TILES_PER_BOARD = 64
 PIECE_SYMBOLS = 'prbnkqPRBNKQ'
 
-# Default model path (relative to this file)
+MODEL_BACKENDS = ('keras', 'onnx')
+
+# Default model paths (relative to this file)
 DEFAULT_MODEL_PATH = Path(__file__).parent / 'models' / 'ensemble_medium.keras'
+DEFAULT_ONNX_MODEL_PATH = Path(__file__).parent / 'models' / 'ensemble_medium.onnx'
 
 
 def weighted_categorical_crossentropy(weights):
     """Custom loss function for loading the model."""
+    import tensorflow as tf
+
     weights = tf.constant(weights, dtype=tf.float32)
 
     def loss(y_true, y_pred):
@@ -38,21 +57,88 @@ def weighted_categorical_crossentropy(weights):
     return loss
 
 
-def load_model(model_path: str | Path | None = None) -> keras.Model:
-    """Load the chess piece recognition model.
+def configure_threads(intra_op: int = 0, inter_op: int = 0) -> None:
+    """Set TensorFlow thread pool sizes. Must be called before the first TF op runs.
+
+    Only needed for the keras backend; the onnx backend takes its thread
+    counts in load_model().
 
     Args:
-        model_path: Path to the model file. If None, uses default path.
+        intra_op: Threads used inside a single op (0 = TensorFlow default)
+        inter_op: Threads used to run independent ops in parallel (0 = TensorFlow default)
+    """
+    import tensorflow as tf
 
-    Returns:
-        Loaded Keras model
+    if intra_op > 0:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+    if inter_op > 0:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+
+
+class OnnxModel:
+    """The exported ensemble run by ONNX Runtime, with a Keras-style predict().
+
+    Args:
+        model_path: Path to the .onnx file
+        intra_op: Threads used inside a single op (0 = ONNX Runtime default)
+        inter_op: Threads used to run independent ops in parallel (0 = default)
     """
+
+    def __init__(self, model_path: str | Path, intra_op: int = 0, inter_op: int = 0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op > 0:
+            options.intra_op_num_threads = intra_op
+        if inter_op > 0:
+            options.inter_op_num_threads = inter_op
+        self.session = ort.InferenceSession(str(model_path), options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_shape = tuple(None if isinstance(d, str) else d for d in model_input.shape)
+
+    def __call__(self, tiles: np.ndarray) -> np.ndarray:
+        """Run the model on (N, 40, 40, 3) tiles and return the (N, 13) output."""
+        tiles = np.asarray(tiles, dtype=np.float32)
+        return self.session.run(None, {self.input_name: tiles})[0]
+
+    def predict(self, x: np.ndarray, verbose: int = 0) -> np.ndarray:
+        """Keras-compatible alias of __call__()."""
+        return self(x)
+
+
+def model_file(model_path: str | Path | None = None, backend: str = 'keras') -> Path:
+    """Path of the model file load_model() reads: model_path, or the backend's default."""
     if model_path is None:
-        model_path = DEFAULT_MODEL_PATH
+        model_path = DEFAULT_ONNX_MODEL_PATH if backend == 'onnx' else DEFAULT_MODEL_PATH
+    return Path(model_path)
+
+
+def load_model(model_path: str | Path | None = None, backend: str = 'keras',
+               intra_op: int = 0, inter_op: int = 0) -> keras.Model | OnnxModel:
+    """Load the chess piece recognition model.
+
+    Args:
+        model_path: Path to the model file. If None, uses the backend's default path.
+        backend: 'keras' (TensorFlow) or 'onnx' (ONNX Runtime)
+        intra_op: ONNX Runtime intra-op threads (keras: use configure_threads())
+        inter_op: ONNX Runtime inter-op threads
 
-    model_path = Path(model_path)
+    Returns:
+        Loaded Keras model, or OnnxModel for the onnx backend
+    """
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown model backend {backend!r}; expected one of {MODEL_BACKENDS}")
+    model_path = model_file(model_path, backend)
     if not model_path.exists():
-        raise FileNotFoundError(f"Model not found at: {model_path}")
+        hint = " (create it with export_onnx.py)" if backend == 'onnx' else ""
+        raise FileNotFoundError(f"Model not found at: {model_path}{hint}")
+
+    if backend == 'onnx':
+        return OnnxModel(model_path, intra_op=intra_op, inter_op=inter_op)
+
+    import keras
 
     try:
         model = keras.models.load_model(model_path)
@@ -71,6 +157,150 @@ def load_model(model_path: str | Path | None = None) -> keras.Model:
     return model
 
 
+def batch_buckets(max_boards: int, min_tiles: int = 16) -> tuple[int, ...]:
+    """Input sizes (in tiles) to compile the inference graph for.
+
+    A small bucket for partial boards (live tracking), then whole boards in
+    powers of two up to max_boards.
+    """
+    buckets = {max(1, min_tiles), max(1, max_boards) * TILES_PER_BOARD}
+    boards = 1
+    while boards < max_boards:
+        buckets.add(boards * TILES_PER_BOARD)
+        boards *= 2
+    return tuple(sorted(buckets))
+
+
+class InferenceRunner:
+    """Model inference through graphs compiled once for fixed input sizes.
+
+    model.predict() sets up a full Keras predict loop (data adapter,
+    callbacks, step function) on every call, which costs more than the model
+    itself for a few boards of 40x40 tiles. The runner instead traces
+    model(x, training=False) at load time for each bucket size, pads every
+    input up to the next bucket and calls the traced graph directly. Inputs
+    larger than the largest bucket are split into chunks.
+
+    An OnnxModel needs no tracing; it is called directly with the same
+    bucket padding, so both backends see the same input sizes.
+
+    Has a Keras-style predict(), so it can be used wherever a model is.
+
+    Args:
+        model: Loaded Keras model or OnnxModel
+        buckets: Input sizes (tiles) to compile (default batch_buckets(8))
+    """
+
+    def __init__(self, model: keras.Model | OnnxModel, buckets: tuple[int, ...] | None = None):
+        self.model = model
+        self.buckets = tuple(sorted(set(buckets or batch_buckets(8))))
+        if isinstance(model, OnnxModel):
+            self._run = lambda size, tiles: model(tiles)
+            return
+
+        import tensorflow as tf
+
+        call = tf.function(lambda x: model(x, training=False))
+        graphs = {
+            size: call.get_concrete_function(tf.TensorSpec((size, SQUARE_SIZE, SQUARE_SIZE, 3), tf.float32))
+            for size in self.buckets
+        }
+        self._run = lambda size, tiles: graphs[size](tf.constant(tiles)).numpy()
+
+    def __call__(self, tiles: np.ndarray) -> np.ndarray:
+        """Run the model on (N, 40, 40, 3) tiles and return the (N, 13) output."""
+        tiles = np.asarray(tiles, dtype=np.float32)
+        n = len(tiles)
+        largest = self.buckets[-1]
+        if n > largest:
+            return np.concatenate([self(tiles[i:i + largest]) for i in range(0, n, largest)])
+
+        size = next(b for b in self.buckets if b >= n)
+        if size != n:
+            padded = np.zeros((size, *tiles.shape[1:]), dtype=np.float32)
+            padded[:n] = tiles
+            tiles = padded
+        return self._run(size, tiles)[:n]
+
+    def predict(self, x: np.ndarray, verbose: int = 0) -> np.ndarray:
+        """Keras-compatible alias of __call__()."""
+        return self(x)
+
+
+def fold_models(model: keras.Model) -> list[keras.Model]:
+    """The fold networks summed by the ensemble (its nested Keras models)."""
+    import keras
+
+    return [layer for layer in model.layers if isinstance(layer, keras.Model)]
+
+
+class CascadeRunner:
+    """Ensemble inference that consults the other folds only for uncertain tiles.
+
+    Most squares (empty ones above all) are classified with near certainty
+    by any fold. The cascade runs the first fold on every tile, then runs
+    the remaining folds only on tiles whose top-class probability is below
+    the threshold, and sums all folds for those tiles exactly as the
+    ensemble does. Confident tiles get the first fold's output scaled by the
+    number of folds, so every tile's scores sum to the same total as the
+    full ensemble's and predictions_to_fen() reads confidences the same way.
+
+    Each fold runs through its own InferenceRunner. Has a Keras-style
+    predict(), so it can be used wherever a model is.
+
+    Args:
+        model: Loaded Keras ensemble (keras backend only)
+        threshold: Top-class probability of the first fold below which a tile is escalated
+        buckets: Input sizes (tiles) to compile for each fold (default batch_buckets(8))
+        on_call: Called with (tiles, escalated tiles) after every call, e.g. for metrics
+    """
+
+    def __init__(self, model: keras.Model, threshold: float, buckets: tuple[int, ...] | None = None,
+                 on_call: Callable[[int, int], None] | None = None):
+        folds = fold_models(model) if not isinstance(model, OnnxModel) else []
+        if len(folds) < 2:
+            raise ValueError("Cascade inference needs a Keras ensemble of at least two fold models")
+        self.model = model
+        self.threshold = threshold
+        self.runners = [InferenceRunner(fold, buckets) for fold in folds]
+        self.buckets = self.runners[0].buckets
+        self.on_call = on_call
+        self._lock = threading.Lock()
+        self.tiles = 0
+        self.escalated = 0
+
+    def __call__(self, tiles: np.ndarray) -> np.ndarray:
+        """Run the cascade on (N, 40, 40, 3) tiles and return the (N, 13) ensemble-scale output."""
+        tiles = np.asarray(tiles, dtype=np.float32)
+        first = self.runners[0](tiles)
+        uncertain = np.flatnonzero(first.max(axis=1) < self.threshold)
+
+        scores = first * len(self.runners)
+        if len(uncertain):
+            hard = tiles[uncertain]
+            scores[uncertain] = first[uncertain] + sum(runner(hard) for runner in self.runners[1:])
+
+        with self._lock:
+            self.tiles += len(tiles)
+            self.escalated += len(uncertain)
+        if self.on_call is not None:
+            self.on_call(len(tiles), len(uncertain))
+        return scores
+
+    def predict(self, x: np.ndarray, verbose: int = 0) -> np.ndarray:
+        """Keras-compatible alias of __call__()."""
+        return self(x)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'threshold': self.threshold,
+                'tiles': self.tiles,
+                'escalated': self.escalated,
+                'escalated_fraction': self.escalated / self.tiles if self.tiles else 0.0,
+            }
+
+
 def process_board_for_model(board_image: np.ndarray) -> np.ndarray:
     """Process cropped board into 64 squares (64, 40, 40, 3) for model prediction.
 
@@ -153,11 +383,11 @@ def create_chesscom_link(simple_fen: str, active_color: str = 'w') -> str:
     return f"https://www.chess.com/analysis?fen={encoded_fen}"
 
 
-def predict_fen(model: keras.Model, board_image: np.ndarray, active_color: str = 'w') -> dict:
+def predict_fen(model: keras.Model | OnnxModel | InferenceRunner | CascadeRunner, board_image: np.ndarray, active_color: str = 'w') -> dict:
     """Run model inference on cropped board and generate FEN.
 
     Args:
-        model: Loaded Keras model
+        model: Loaded model of either backend (see load_model()) or an InferenceRunner
         board_image: Cropped board image (RGB)
 
     Returns:
@@ -172,8 +402,23 @@ def predict_fen(model: keras.Model, board_image: np.ndarray, active_color: str =
     """
     squares = process_board_for_model(board_image)
     predictions = model.predict(squares, verbose=0)
+    return predictions_to_fen(predictions, active_color=active_color)
+
+
+def predictions_to_fen(predictions: np.ndarray, active_color: str = 'w') -> dict:
+    """Turn raw model output for one board into the predict_fen() result dict.
+
+    Args:
+        predictions: Model output of shape (64, 13) for a single board
+        active_color: 'w' or 'b'
+
+    Returns:
+        Same dictionary as predict_fen()
+    """
     predicted_classes = predictions.argmax(axis=1)
-    confidences = predictions.max(axis=1) / 3  # ensemble of 3 models
+    # Scores of the 3-fold ensemble sum to 3 per square, a distilled student's
+    # to 1; normalizing makes the confidence a probability for either
+    confidences = predictions.max(axis=1) / predictions.sum(axis=1)
 
     predicted_board = predicted_classes.reshape(8, 8)
     fen_simple = onehot_to_fen(predicted_board)
@@ -0,0 +1,145 @@
+"""
+Image Decoding
+
+Uploaded images are checked against a pixel budget using only their header
+before any pixel data is decoded, so a small file that expands to hundreds of
+megapixels (a decompression bomb) is rejected without allocating its buffer.
+
+Two decode backends are available:
+- 'cv2': cv2.imdecode straight from the byte buffer into a NumPy array
+  (BGR, converted to RGB in place)
+- 'pil': PIL decode, exposed to NumPy without an extra copy
+
+Both can decode at reduced resolution (1/2, 1/4, 1/8) when an image is far
+larger than board detection needs. For JPEG this happens inside the decoder
+(DCT scaling via IMREAD_REDUCED_* or PIL's draft mode), so the full-size
+image is never materialised.
+"""
+
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+DECODE_BACKENDS = ('cv2', 'pil')
+
+_CV2_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class ImageTooLarge(ValueError):
+    """Raised when an image's header dimensions exceed the pixel budget.
+
+    width and height are None when PIL refused to open the image as a
+    decompression bomb, which happens before its dimensions are exposed.
+    """
+
+    def __init__(self, width: int | None, height: int | None, max_pixels: int):
+        if width is None or height is None:
+            message = f"Image exceeds the maximum of {max_pixels:,} pixels"
+        else:
+            message = f"Image is {width}x{height} pixels; the maximum is {max_pixels:,} pixels"
+        super().__init__(message)
+        self.width = width
+        self.height = height
+        self.max_pixels = max_pixels
+
+
+def _open_within_budget(data: bytes, max_pixels: int) -> Image.Image:
+    """Open an image lazily (header only) and check its size against max_pixels."""
+    try:
+        image = Image.open(io.BytesIO(data))
+    except Image.DecompressionBombError:
+        # PIL's own limit (2 * Image.MAX_IMAGE_PIXELS) is far above any budget we serve
+        raise ImageTooLarge(None, None, max_pixels) from None
+    width, height = image.size
+    if width * height > max_pixels:
+        image.close()
+        raise ImageTooLarge(width, height, max_pixels)
+    return image
+
+
+def probe_size(data: bytes, max_pixels: int) -> tuple[int, int]:
+    """Read (width, height) from the image header without decoding pixel data.
+
+    Raises:
+        ImageTooLarge: If the header dimensions exceed max_pixels
+        PIL.UnidentifiedImageError: If the header cannot be read
+    """
+    with _open_within_budget(data, max_pixels) as image:
+        return image.size
+
+
+def reduction_factor(width: int, height: int, max_side: int | None) -> int:
+    """Largest power-of-two reduction (1, 2, 4 or 8) that keeps the longer side >= max_side.
+
+    Args:
+        width: Full image width
+        height: Full image height
+        max_side: Longer side that detection needs; None or 0 disables reduction
+    """
+    if not max_side:
+        return 1
+    longest = max(width, height)
+    factor = 1
+    while factor < 8 and longest // (factor * 2) >= max_side:
+        factor *= 2
+    return factor
+
+
+def _decode_cv2(data: bytes, factor: int) -> np.ndarray:
+    # Ignore EXIF orientation, matching PIL, so both backends see the same pixels
+    flags = _CV2_REDUCED_FLAGS[factor] | cv2.IMREAD_IGNORE_ORIENTATION
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+    if image is None:
+        raise ValueError("cv2.imdecode could not decode the image")
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+
+
+def _decode_pil(image: Image.Image, factor: int) -> np.ndarray:
+    if factor > 1:
+        width, height = image.size
+        if image.format == "JPEG":
+            image.draft("RGB", (width // factor, height // factor))
+        if image.size == (width, height):
+            # Not a JPEG, so draft mode did not apply: reduce after decoding
+            image = image.reduce(factor)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    # asarray wraps PIL's buffer without a second copy (the array is read-only)
+    return np.asarray(image)
+
+
+def decode_image(data: bytes, max_pixels: int, backend: str = 'cv2',
+                 max_side: int | None = None) -> tuple[np.ndarray, int]:
+    """Decode image bytes into an RGB numpy array, enforcing a pixel budget first.
+
+    Args:
+        data: Encoded image (PNG, JPEG or WEBP)
+        max_pixels: Maximum width * height allowed
+        backend: 'cv2' or 'pil'
+        max_side: If set, decode at 1/2, 1/4 or 1/8 scale as long as the
+            longer side stays at least this long
+
+    Returns:
+        (RGB image array, reduction factor applied; multiply coordinates by it
+        to map back to the full-size image)
+
+    Raises:
+        ImageTooLarge: If the header dimensions exceed max_pixels
+    """
+    if backend not in DECODE_BACKENDS:
+        raise ValueError(f"Unknown decode backend: {backend!r}")
+
+    image = _open_within_budget(data, max_pixels)
+    width, height = image.size
+    factor = reduction_factor(width, height, max_side)
+
+    if backend == 'cv2':
+        return _decode_cv2(data, factor), factor
+    return _decode_pil(image, factor), factor
@@ -0,0 +1,293 @@
+"""
+Asynchronous Job Spool
+
+Bulk conversions that take minutes should not hold an HTTP connection open.
+POST /jobs stores the uploaded files in an on-disk spool and returns a job
+id at once; worker processes pick queued jobs up in the background and
+append one result line per image, which GET /jobs/{id} reads back.
+
+Layout of a job directory (<spool>/<job id>/):
+- input/: the uploaded images and archives
+- state.json: status, parameters and timestamps (replaced atomically)
+- results.ndjson: one JSON line per processed image, in input order
+- claim: flock()ed by the worker processing the job
+
+The lock is released by the kernel when its worker dies, so another worker
+(or the restarted one) claims the job and resumes after the last complete
+result line. A job whose input crashes every worker that claims it is
+marked failed after max_attempts claims in a row that added no result. The
+spool is bounded: new jobs are refused while it holds
+max_bytes, and finished jobs are deleted after ttl_seconds.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import BinaryIO
+
+logger = logging.getLogger(__name__)
+
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+FINISHED_STATES = ('done', 'failed')
+
+
+class SpoolFull(Exception):
+    """Raised when accepting a job would exceed the spool's size budget."""
+
+
+def _write_json_atomic(path: Path, value: dict) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(value, f)
+    os.replace(tmp, path)
+
+
+def _safe_filename(name: str, index: int) -> str:
+    """Spool file name for an upload: index prefix keeps the order, the rest is sanitized."""
+    base = re.sub(r"[^A-Za-z0-9._-]", "_", Path(name).name)[:100] or "upload"
+    return f"{index:04d}-{base}"
+
+
+class JobClaim:
+    """A job locked for processing by this worker. Release it when done."""
+
+    def __init__(self, directory: Path, fd: int):
+        self.directory = directory
+        self.job_id = directory.name
+        self._fd = fd
+        self.completed = 0
+        self.failed = 0
+        self._recover_results()
+
+    def _recover_results(self) -> None:
+        """Count the complete result lines, dropping a partial last line left by a crash."""
+        path = self.directory / "results.ndjson"
+        if not path.exists():
+            return
+        data = path.read_bytes()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            with path.open("r+b") as f:
+                f.truncate(end)
+        for line in data[:end].splitlines():
+            self.completed += 1
+            self.failed += 1 if json.loads(line).get('error') else 0
+
+    def state(self) -> dict:
+        return json.loads((self.directory / "state.json").read_text())
+
+    def update(self, **fields) -> dict:
+        """Merge fields into state.json and bump its update time."""
+        state = self.state()
+        state.update(fields, updated_at=time.time())
+        _write_json_atomic(self.directory / "state.json", state)
+        return state
+
+    def append(self, result: dict) -> None:
+        """Append one result line and record the progress."""
+        with (self.directory / "results.ndjson").open("ab") as f:
+            f.write(json.dumps(result, separators=(",", ":")).encode() + b"\n")
+        self.completed += 1
+        self.failed += 1 if result.get('error') else 0
+        self.update(processed=self.completed, failed=self.failed)
+
+    def release(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class JobSpool:
+    """On-disk queue of jobs shared by every worker process on the host.
+
+    Args:
+        directory: Spool directory (created if missing)
+        max_bytes: Total size of all job directories above which new jobs are refused
+        ttl_seconds: Age after which finished jobs are deleted
+        max_attempts: Claims in a row without a new result line after which a
+            job is marked failed instead of being retried
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int, ttl_seconds: float, max_attempts: int = 3):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.max_attempts = max_attempts
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _job_dir(self, job_id: str) -> Path | None:
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        path = self.directory / job_id
+        return path if (path / "state.json").exists() else None
+
+    def usage(self) -> int:
+        """Bytes used by all jobs in the spool."""
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                try:
+                    total += os.stat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass
+        return total
+
+    def create(self, uploads: list[tuple[str, BinaryIO]], params: dict) -> str:
+        """Spool uploaded files as a new queued job.
+
+        Args:
+            uploads: (filename, readable binary file positioned at 0) pairs
+            params: Processing parameters stored with the job (e.g. active_color)
+
+        Returns:
+            The job id
+
+        Raises:
+            SpoolFull: If the spool has no room for these files
+        """
+        incoming = 0
+        for _, fileobj in uploads:
+            fileobj.seek(0, os.SEEK_END)
+            incoming += fileobj.tell()
+            fileobj.seek(0)
+        if self.usage() + incoming > self.max_bytes:
+            raise SpoolFull(f"Job spool is full ({self.max_bytes // (1024 * 1024)} MB)")
+
+        job_id = uuid.uuid4().hex
+        # Build the job in a temporary directory, then rename it into place, so
+        # workers never see a job whose inputs are still being written
+        staging = Path(tempfile.mkdtemp(dir=self.directory, prefix=".incoming-"))
+        try:
+            (staging / "input").mkdir()
+            names = []
+            for index, (filename, fileobj) in enumerate(uploads):
+                with (staging / "input" / _safe_filename(filename, index)).open("wb") as out:
+                    shutil.copyfileobj(fileobj, out, 1024 * 1024)
+                names.append(filename)
+            now = time.time()
+            _write_json_atomic(staging / "state.json", {
+                'job_id': job_id,
+                'status': 'queued',
+                'params': params,
+                'filenames': names,
+                'processed': 0,
+                'failed': 0,
+                'total': None,
+                'error': None,
+                'attempts': 0,
+                'attempt_start': 0,
+                'created_at': now,
+                'updated_at': now,
+            })
+            os.rename(staging, self.directory / job_id)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return job_id
+
+    def state(self, job_id: str) -> dict | None:
+        """The job's state.json, or None if there is no such job."""
+        path = self._job_dir(job_id)
+        if path is None:
+            return None
+        try:
+            return json.loads((path / "state.json").read_text())
+        except (OSError, ValueError):
+            return None
+
+    def results(self, job_id: str, offset: int = 0, limit: int | None = None) -> list[dict]:
+        """Complete result lines of a job, starting at offset."""
+        path = self._job_dir(job_id)
+        if path is None or not (path / "results.ndjson").exists():
+            return []
+        results = []
+        with (path / "results.ndjson").open("rb") as f:
+            for i, line in enumerate(f):
+                if i < offset or not line.endswith(b"\n"):
+                    continue
+                if limit is not None and len(results) >= limit:
+                    break
+                results.append(json.loads(line))
+        return results
+
+    def inputs(self, claim: JobClaim) -> list[tuple[str, Path]]:
+        """(original filename, spooled path) of a claimed job's uploads, in upload order."""
+        names = claim.state()['filenames']
+        paths = sorted((claim.directory / "input").iterdir())
+        return list(zip(names, paths))
+
+    def claim_next(self) -> JobClaim | None:
+        """Lock the oldest unfinished job that no other worker is processing."""
+        candidates = []
+        for path in self.directory.iterdir():
+            if not JOB_ID_PATTERN.match(path.name):
+                continue
+            try:
+                state = json.loads((path / "state.json").read_text())
+            except (OSError, ValueError):
+                continue
+            if state['status'] not in FINISHED_STATES:
+                candidates.append((state['created_at'], path))
+
+        for _, path in sorted(candidates):
+            fd = os.open(path / "claim", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            claim = JobClaim(path, fd)
+            state = claim.state()
+            # Another worker may have finished it between the scan and the lock
+            if state['status'] in FINISHED_STATES:
+                claim.release()
+                continue
+            if self._give_up(claim, state):
+                claim.release()
+                continue
+            return claim
+        return None
+
+    def _give_up(self, claim: JobClaim, state: dict) -> bool:
+        """Count this claim as an attempt; fail the job if too many made no progress.
+
+        An earlier claim that appended results was a restart, not a crash on
+        this job's input, so progress starts the count again.
+        """
+        attempts = state.get('attempts', 0)
+        if claim.completed > state.get('attempt_start', 0):
+            attempts = 0
+        attempts += 1
+        if attempts > self.max_attempts:
+            logger.error("Job %s: giving up after %d attempts without progress at item %d",
+                         claim.job_id, attempts - 1, claim.completed)
+            claim.update(status='failed', error=f"Gave up after {attempts - 1} attempts that each "
+                                                f"stopped at item {claim.completed}.")
+            return True
+        claim.update(attempts=attempts, attempt_start=claim.completed)
+        return False
+
+    def prune(self) -> None:
+        """Delete finished jobs older than the TTL and abandoned staging directories."""
+        now = time.time()
+        for path in self.directory.iterdir():
+            try:
+                if path.name.startswith(".incoming-"):
+                    if now - path.stat().st_mtime > self.ttl:
+                        shutil.rmtree(path, ignore_errors=True)
+                    continue
+                if not JOB_ID_PATTERN.match(path.name):
+                    continue
+                state = json.loads((path / "state.json").read_text())
+            except (OSError, ValueError):
+                continue
+            if state['status'] in FINISHED_STATES and now - state['updated_at'] > self.ttl:
+                logger.info("Deleting expired job %s", path.name)
+                shutil.rmtree(path, ignore_errors=True)
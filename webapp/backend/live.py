@@ -0,0 +1,135 @@
+"""
+Live Board Tracking
+
+Following a game from a screen-capture feed means classifying many frames
+that are almost identical. A LiveBoardTracker keeps per-stream state so each
+frame only pays for what changed:
+1. Reuse the previous frame's board bbox when the frame size is unchanged
+2. Compare small grayscale thumbnails of the 64 squares against the previous
+   frame to find the squares whose pixels changed
+3. If too many squares changed, the layout probably moved (scroll, resize,
+   board flip): run full detect_board() again and reclassify everything
+4. Otherwise classify only the changed squares and merge them into the
+   previous predictions
+
+The model call itself is left to the caller (plan() then commit()), so the
+tracker works with both a direct model and the micro-batcher.
+"""
+
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+from board_detection import detect_board
+from fen_generator import predictions_to_fen, process_board_for_model
+
+THUMB_SIZE = 12  # thumbnail pixels per square side used for change detection
+
+
+def tile_thumbnails(board_image: np.ndarray) -> np.ndarray:
+    """Grayscale thumbnails of the 64 squares of a cropped board, shape (64, THUMB_SIZE, THUMB_SIZE)."""
+    gray = cv2.cvtColor(board_image, cv2.COLOR_RGB2GRAY) if board_image.ndim == 3 else board_image
+    side = THUMB_SIZE * 8
+    small = cv2.resize(gray, (side, side), interpolation=cv2.INTER_AREA).astype(np.float32)
+    return small.reshape(8, THUMB_SIZE, 8, THUMB_SIZE).swapaxes(1, 2).reshape(64, THUMB_SIZE, THUMB_SIZE)
+
+
+def changed_tiles(previous: np.ndarray, current: np.ndarray, threshold: float) -> np.ndarray:
+    """Boolean mask (64,) of squares whose mean absolute thumbnail difference exceeds threshold."""
+    return np.abs(current - previous).mean(axis=(1, 2)) > threshold
+
+
+@dataclass
+class FramePlan:
+    """What has to be classified for one frame."""
+    bbox: tuple[int, int, int, int]
+    thumbnails: np.ndarray
+    changed: np.ndarray          # (64,) bool: squares to (re)classify
+    tiles: np.ndarray | None     # (n_changed, 40, 40, 3) model input, None if nothing changed
+    redetected: bool
+
+
+class LiveBoardTracker:
+    """Per-stream state for incremental board classification.
+
+    Args:
+        tile_threshold: Mean grey-level difference above which a square counts as changed
+        max_changed_tiles: More changed squares than this triggers full board re-detection
+    """
+
+    def __init__(self, tile_threshold: float = 6.0, max_changed_tiles: int = 16):
+        self.tile_threshold = tile_threshold
+        self.max_changed_tiles = max_changed_tiles
+        self.frame_shape: tuple | None = None
+        self.bbox: tuple[int, int, int, int] | None = None
+        self.thumbnails: np.ndarray | None = None
+        self.predictions: np.ndarray | None = None
+        self.fen: str | None = None
+
+    def reset(self) -> None:
+        """Forget the board; the next frame runs full detection."""
+        self.frame_shape = None
+        self.bbox = None
+        self.thumbnails = None
+        self.predictions = None
+
+    def plan(self, frame: np.ndarray) -> FramePlan | None:
+        """Work out which squares of this frame need the model.
+
+        Args:
+            frame: RGB frame
+
+        Returns:
+            FramePlan, or None if no board could be found in the frame
+        """
+        if self.bbox is not None and frame.shape == self.frame_shape:
+            y0, y1, x0, x1 = self.bbox
+            cropped = frame[y0:y1, x0:x1]
+            thumbnails = tile_thumbnails(cropped)
+            changed = changed_tiles(self.thumbnails, thumbnails, self.tile_threshold)
+            n_changed = int(changed.sum())
+            if n_changed == 0:
+                return FramePlan(self.bbox, thumbnails, changed, None, False)
+            if n_changed <= self.max_changed_tiles:
+                tiles = process_board_for_model(cropped)[changed]
+                return FramePlan(self.bbox, thumbnails, changed, tiles, False)
+
+        # First frame, new frame size, or too much changed: full detection
+        cropped, bbox, success = detect_board(frame)
+        if not success:
+            self.reset()
+            return None
+        self.frame_shape = frame.shape
+        changed = np.ones(64, dtype=bool)
+        return FramePlan(bbox, tile_thumbnails(cropped), changed, process_board_for_model(cropped), True)
+
+    def commit(self, plan: FramePlan, predictions: np.ndarray | None, active_color: str = 'w') -> dict | None:
+        """Merge model output for the planned squares and build the FEN.
+
+        Args:
+            plan: Plan returned by plan() for this frame
+            predictions: Model output for plan.tiles (None if nothing changed)
+            active_color: 'w' or 'b'
+
+        Returns:
+            predict_fen()-style result if the position changed, else None
+        """
+        if predictions is None and not plan.redetected:
+            # No square changed: keep the previous thumbnails as the reference,
+            # so slow drifts still accumulate into a detectable change
+            return None
+        if plan.redetected or self.predictions is None:
+            merged = predictions
+        else:
+            merged = self.predictions.copy()
+            merged[plan.changed] = predictions
+        self.bbox = plan.bbox
+        self.thumbnails = plan.thumbnails
+        self.predictions = merged
+
+        result = predictions_to_fen(merged, active_color=active_color)
+        if result['fen'] == self.fen:
+            return None
+        self.fen = result['fen']
+        return result
@@ -0,0 +1,192 @@
+"""
+Prometheus Metrics
+
+Per-stage latency histograms and service counters, exported at /metrics.
+
+Stages (label of fen_stage_seconds):
+- upload_read: receiving / reading the upload
+- decode: image decode to an RGB array
+- rough_crop: contour-based rough crop (rough_crop_board)
+- sobel: histogram equalization, Sobel gradients and projections
+- line_search: adaptive threshold / grid line search loop
+- tile_resize: resizing the board into 64 model tiles
+- empty_filter: empty-square pre-classifier, with EMPTY_SKIP=1 (empty_squares.py)
+- inference: one model call (per micro-batch, not per board)
+- annotate: drawing the bbox on the (downscaled) image
+- encode: encoding the annotated image and base64
+
+RequestTimings collects the same stages for a single request, for the
+optional per-response breakdown (?timings=true) and Server-Timing header.
+
+With the pre-fork server (serve.py), set PROMETHEUS_MULTIPROC_DIR to an empty
+directory so every worker's metrics are aggregated into one scrape.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest,
+)
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_SECONDS = Histogram(
+    "fen_stage_seconds", "Time spent in each processing stage", ["stage"], buckets=STAGE_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "fen_request_seconds", "End-to-end request latency", ["path", "status"], buckets=STAGE_BUCKETS,
+)
+INFERENCE_BATCH_BOARDS = Histogram(
+    "fen_inference_batch_boards", "Boards per model call", buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+THRESHOLD_LEVELS = Histogram(
+    "fen_detection_threshold_levels", "Adaptive threshold levels tried per detection", buckets=(1, 2, 3, 4),
+)
+DETECTION_FAILURES = Counter(
+    "fen_detection_failures_total", "Images in which no chessboard was detected",
+)
+CACHE_LOOKUPS = Counter(
+    "fen_cache_lookups_total", "Cache lookups by cache and outcome", ["cache", "result"],
+)
+CASCADE_TILES = Counter(
+    "fen_cascade_tiles_total", "Tiles classified by the cascade, by whether all folds were consulted", ["result"],
+)
+EMPTY_TILES_SKIPPED = Counter(
+    "fen_empty_tiles_skipped_total", "Tiles classified as empty by the pre-filter without the model",
+)
+REJECTED_REQUESTS = Counter(
+    "fen_rejected_requests_total", "Requests rejected by load shedding", ["reason"],
+)
+QUEUE_DEPTH = Gauge(
+    "fen_executor_queue_depth", "Tasks waiting for an executor thread", ["lane"], multiprocess_mode="livesum",
+)
+IN_FLIGHT_PIXELS = Gauge(
+    "fen_admission_in_flight_pixels", "Pixel cost of admitted images still being processed",
+    multiprocess_mode="livesum",
+)
+IN_FLIGHT = Gauge(
+    "fen_requests_in_flight", "HTTP requests currently being processed", multiprocess_mode="livesum",
+)
+
+
+class RequestTimings:
+    """Stage durations and image details of one request.
+
+    Stages recorded through observe_stage()/timed() with a RequestTimings are
+    also observed in the fen_stage_seconds histogram.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        self.info: dict = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        """Add seconds to a stage (stages may run more than once per request)."""
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def as_dict(self) -> dict:
+        """JSON-ready breakdown: total and per-stage milliseconds plus image details."""
+        return {
+            'total_ms': round((time.perf_counter() - self.start) * 1000, 2),
+            'stages_ms': {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()},
+            **self.info,
+        }
+
+    def server_timing(self) -> str:
+        """Value of a Server-Timing header, e.g. 'decode;dur=3.21, sobel;dur=8.40, total;dur=25.02'."""
+        entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in self.stages.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.2f}")
+        return ", ".join(entries)
+
+
+def observe_stage(stage: str, seconds: float, timings: RequestTimings | None = None) -> None:
+    """Record the duration of one stage, and add it to the request's timings if given."""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage: str, timings: RequestTimings | None = None):
+    """Context manager recording the duration of the enclosed block as a stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start, timings)
+
+
+def observe_detection(detection: dict, success: bool, timings: RequestTimings | None = None) -> None:
+    """Record the stage timings filled in by detect_board(timings=...)."""
+    for stage in ('rough_crop', 'sobel', 'line_search'):
+        if stage in detection:
+            observe_stage(stage, detection[stage], timings)
+    if 'threshold_levels' in detection:
+        THRESHOLD_LEVELS.observe(detection['threshold_levels'])
+    if not success:
+        DETECTION_FAILURES.inc()
+    if timings is not None:
+        timings.info.update({
+            'board_detected': success,
+            'threshold_levels': detection.get('threshold_levels'),
+            'refined': detection.get('refined'),
+            'rough_crop_found': detection.get('crop_found'),
+        })
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_cascade(tiles: int, escalated: int) -> None:
+    CASCADE_TILES.labels("confident").inc(tiles - escalated)
+    CASCADE_TILES.labels("escalated").inc(escalated)
+
+
+def render_latest() -> tuple[bytes, str]:
+    """Serialize all metrics in the Prometheus text format.
+
+    Returns:
+        (body, content type)
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware tracking in-flight HTTP requests and their latency per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.dec()
+            # Label by route template (e.g. /jobs/{job_id}), not the raw path
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            REQUEST_SECONDS.labels(path, str(status)).observe(time.perf_counter() - start)
@@ -7,9 +7,7 @@ for displaying detection steps in the web UI.
 
 import cv2
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 
 
 def _resize_for_viz(img: np.ndarray, max_width: int = 600) -> np.ndarray:
@@ -81,8 +79,13 @@ def viz_gradients(grad_x: np.ndarray, grad_y: np.ndarray) -> bytes:
 
 def viz_projections(hough_Dx: np.ndarray, hough_Dy: np.ndarray,
                     lines_x: list, lines_y: list) -> bytes:
-    """Create matplotlib 2-subplot figure with projection signals and detected peaks."""
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(8, 4), dpi=100)
+    """Create matplotlib 2-subplot figure with projection signals and detected peaks.
+
+    Uses the object-oriented Figure API rather than pyplot, whose global figure
+    state is not safe to use from the worker threads that render these.
+    """
+    fig = Figure(figsize=(8, 4), dpi=100)
+    ax1, ax2 = fig.subplots(2, 1)
     fig.patch.set_facecolor('#1a1a1a')
 
     for ax, signal, lines, label in [
@@ -108,7 +111,6 @@ def viz_projections(hough_Dx: np.ndarray, hough_Dy: np.ndarray,
     buf = io.BytesIO()
     fig.savefig(buf, format='png', facecolor=fig.get_facecolor(),
                 edgecolor='none', bbox_inches='tight')
-    plt.close(fig)
     buf.seek(0)
     return buf.read()
 
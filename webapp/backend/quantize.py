@@ -0,0 +1,122 @@
+"""
+INT8 Quantization of the ONNX Ensemble
+
+Turns models/ensemble_medium.onnx (written by export_onnx.py) into a
+statically quantized INT8 model for the onnx backend:
+1. Calibrates activation ranges on tiles from Kaggle test-set boards
+2. Quantizes weights (per channel) and activations to 8 bits
+3. Measures board-level accuracy of the float and INT8 models on other,
+   disjoint test-set boards
+4. Publishes the INT8 model only if its board accuracy reaches
+   --min-board-accuracy; otherwise exits 1 and leaves any previously
+   published model in place
+
+Model size and per-board latency of both models are reported alongside.
+Serve the result with:
+    MODEL_BACKEND=onnx MODEL_PATH=models/ensemble_medium.int8.onnx python serve.py
+
+Usage:
+    python quantize.py [--data ../../data/test] [--calibration-boards 200]
+                       [--eval-boards 2000] [--min-board-accuracy 0.998]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from evaluation import DEFAULT_TEST_DIR, evaluate, latency_per_board, list_boards, load_tiles
+from fen_generator import DEFAULT_ONNX_MODEL_PATH, TILES_PER_BOARD, load_model
+
+DEFAULT_INT8_MODEL_PATH = DEFAULT_ONNX_MODEL_PATH.with_suffix('.int8.onnx')
+
+
+class TileReader(CalibrationDataReader):
+    """Feeds calibration tiles to the quantizer one board at a time."""
+
+    def __init__(self, input_name: str, tiles: np.ndarray):
+        self._batches = iter(
+            {input_name: tiles[i:i + TILES_PER_BOARD]} for i in range(0, len(tiles), TILES_PER_BOARD)
+        )
+
+    def get_next(self) -> dict | None:
+        return next(self._batches, None)
+
+
+def quantize(float_path: Path, int8_path: Path, calibration: list[Path]) -> None:
+    """Write a QDQ INT8 model calibrated on the given boards."""
+    input_name = load_model(float_path, backend='onnx').input_name
+    with tempfile.TemporaryDirectory() as tmp:
+        # Shape inference and graph cleanup let more nodes be quantized
+        prepared = Path(tmp) / 'prepared.onnx'
+        quant_pre_process(str(float_path), str(prepared))
+        quantize_static(
+            str(prepared), str(int8_path),
+            TileReader(input_name, load_tiles(calibration)),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", type=Path, default=DEFAULT_ONNX_MODEL_PATH, help="Float ONNX model")
+    parser.add_argument("--out", type=Path, default=DEFAULT_INT8_MODEL_PATH)
+    parser.add_argument("--data", type=Path, default=DEFAULT_TEST_DIR, help="Kaggle test images (<fen>.jpeg)")
+    parser.add_argument("--calibration-boards", type=int, default=200)
+    parser.add_argument("--eval-boards", type=int, default=2000,
+                        help="Boards, disjoint from the calibration boards, for the accuracy gate")
+    parser.add_argument("--min-board-accuracy", type=float, default=0.998,
+                        help="Lowest INT8 board accuracy that may be published")
+    parser.add_argument("--threads", type=int, default=1, help="Intra-op threads for the latency measurement")
+    args = parser.parse_args()
+
+    boards = list_boards(args.data)
+    calibration = boards[:args.calibration_boards]
+    held_out = boards[args.calibration_boards:args.calibration_boards + args.eval_boards]
+    if not calibration or not held_out:
+        sys.exit(f"Need more than {args.calibration_boards} boards in {args.data}")
+
+    # Write next to the destination and rename on success, so a failed run
+    # never replaces a published model
+    fd, candidate = tempfile.mkstemp(dir=args.out.parent, suffix='.onnx')
+    os.close(fd)
+    candidate = Path(candidate)
+    try:
+        print(f"Calibrating on {len(calibration)} boards...")
+        quantize(args.model, candidate, calibration)
+
+        models = {
+            'float32': (args.model, load_model(args.model, backend='onnx', intra_op=args.threads, inter_op=1)),
+            'int8': (candidate, load_model(candidate, backend='onnx', intra_op=args.threads, inter_op=1)),
+        }
+        print(f"Evaluating on {len(held_out)} held-out boards...\n")
+        print(f"{'model':8s} {'size':>9s} {'board acc':>10s} {'square acc':>11s} "
+              f"{'ms/board (1)':>13s} {'ms/board (8)':>13s}")
+        results = {}
+        for name, (path, model) in models.items():
+            results[name] = evaluate(model, held_out)
+            print(f"{name:8s} {path.stat().st_size / 1024:7.0f}KB {results[name]['board_accuracy']:10.4%} "
+                  f"{results[name]['square_accuracy']:11.5%} {latency_per_board(model, 1):13.3f} "
+                  f"{latency_per_board(model, 8):13.3f}")
+
+        accuracy = results['int8']['board_accuracy']
+        if accuracy < args.min_board_accuracy:
+            print(f"\nINT8 board accuracy {accuracy:.4%} is below {args.min_board_accuracy:.4%}; "
+                  f"not publishing. Misread boards: {results['int8']['wrong_boards'][:10]}", file=sys.stderr)
+            sys.exit(1)
+        os.replace(candidate, args.out)
+        print(f"\nPublished {args.out}")
+    finally:
+        candidate.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
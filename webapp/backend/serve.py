@@ -0,0 +1,176 @@
+"""
+Pre-fork Server Entrypoint
+
+Runs the FastAPI app with one or more worker processes sharing one listening
+socket. TensorFlow (or ONNX Runtime) and the rest of the imports are loaded
+once in the parent; workers are forked afterwards and share those pages
+copy-on-write, so N workers cost far less memory than N independent uvicorn
+processes each importing TensorFlow.
+
+Threads do not survive fork(), so nothing that owns threads is created in
+the parent: the micro-batcher, CPU executor and the model itself (TensorFlow
+and ONNX Runtime both start thread pools when a model is loaded and run) are
+created per worker after the fork. The parent only reads the model file once
+so every worker loads it from the page cache. Inference thread pool sizes
+are set in each worker before its model is loaded.
+
+Environment:
+- PORT: Port to listen on (default 8000)
+- WEB_WORKERS: Number of worker processes (default 1)
+- MODEL_BACKEND: 'keras' (TensorFlow) or 'onnx' (ONNX Runtime, TensorFlow is not imported)
+- TF_INTRA_OP_THREADS: Inference intra-op threads per worker, either backend (default cores / workers)
+- TF_INTER_OP_THREADS: Inference inter-op threads per worker, either backend (default 1)
+- OPENCV_THREADS: OpenCV threads per worker (default cores / workers)
+- PROMETHEUS_MULTIPROC_DIR: Directory where workers share /metrics (should be empty at start)
+
+Usage:
+    python serve.py
+"""
+
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+logger = logging.getLogger("serve")
+
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", "8000"))
+WEB_WORKERS = max(1, int(os.environ.get("WEB_WORKERS", "1")))
+
+_cores = os.cpu_count() or 1
+TF_INTRA_OP_THREADS = int(os.environ.get("TF_INTRA_OP_THREADS", str(max(1, _cores // WEB_WORKERS))))
+TF_INTER_OP_THREADS = int(os.environ.get("TF_INTER_OP_THREADS", "1"))
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "keras")
+OPENCV_THREADS = int(os.environ.get("OPENCV_THREADS", str(max(1, _cores // WEB_WORKERS))))
+
+
+def _bind_socket() -> socket.socket:
+    """Create the listening socket shared by every worker."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((HOST, PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _configure_inference_threads() -> None:
+    """Size TensorFlow's thread pools; must run in the worker before its model is loaded."""
+    if MODEL_BACKEND == "keras":
+        from fen_generator import configure_threads
+        configure_threads(TF_INTRA_OP_THREADS, TF_INTER_OP_THREADS)
+
+
+def _preload_imports_and_weights(app_module) -> None:
+    """Import the inference runtime and read the model file into the page cache.
+
+    Nothing is run or loaded into a runtime, so no inference threads exist
+    before the workers are forked.
+    """
+    if MODEL_BACKEND == "keras":
+        import keras  # noqa: F401
+        import tensorflow  # noqa: F401
+    else:
+        import onnxruntime  # noqa: F401
+    from fen_generator import model_file
+    path = model_file(app_module.MODEL_PATH, MODEL_BACKEND)
+    try:
+        with open(path, "rb") as f:
+            while f.read(16 * 1024 * 1024):
+                pass
+    except OSError as e:
+        logger.warning("Could not preload %s: %s", path, e)
+
+
+def _run_worker(app, sock: socket.socket) -> None:
+    """Serve requests on the inherited socket until told to stop."""
+    import cv2
+    import uvicorn
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    cv2.setNumThreads(OPENCV_THREADS)
+    _configure_inference_threads()
+
+    config = uvicorn.Config(app, log_config=None)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def _spawn(app, sock: socket.socket) -> int:
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _run_worker(app, sock)
+        finally:
+            os._exit(0)
+    logger.info("Started worker pid=%d", pid)
+    return pid
+
+
+def main() -> None:
+    start = time.perf_counter()
+    import app as app_module
+    app_module.INFERENCE_THREADS = (TF_INTRA_OP_THREADS, TF_INTER_OP_THREADS)
+
+    if WEB_WORKERS == 1:
+        _configure_inference_threads()
+        app_module.cold_start['imports'] = time.perf_counter() - start
+        logger.info("Imports took %.1f s", app_module.cold_start['imports'])
+        import uvicorn
+        uvicorn.run(app_module.app, host=HOST, port=PORT)
+        return
+
+    _preload_imports_and_weights(app_module)
+    app_module.cold_start['imports'] = time.perf_counter() - start
+    logger.info("Imports took %.1f s; %d workers load the %s model after forking",
+                app_module.cold_start['imports'], WEB_WORKERS, MODEL_BACKEND)
+
+    sock = _bind_socket()
+    # Move everything allocated so far out of the collector's view, so the
+    # workers' garbage collections do not touch (and un-share) those pages
+    gc.freeze()
+
+    workers = {_spawn(app_module.app, sock) for _ in range(WEB_WORKERS)}
+    stopping = False
+
+    def _shutdown(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            # Drop the dead worker's live gauges (in-flight requests, queue depth)
+            from prometheus_client import multiprocess
+            multiprocess.mark_process_dead(pid)
+        if not stopping:
+            logger.warning("Worker pid=%d exited with status %d; restarting", pid, status)
+            time.sleep(1)
+            workers.add(_spawn(app_module.app, sock))
+
+    sock.close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    main()
@@ -0,0 +1,6 @@
+"""Put the backend modules (flat, not a package) on sys.path, as the benchmarks do."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
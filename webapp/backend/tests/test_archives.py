@@ -0,0 +1,81 @@
+"""iter_archive(): damaged members are reported per item instead of aborting the upload."""
+
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from archives import ArchiveError, ArchiveMemberTooLarge, iter_archive
+
+MAX_SIZE = 1024
+
+
+def _zip(members: dict[str, bytes]) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def _tar(members: dict[str, bytes], mode: str = "w") -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_zip_corrupt_member_is_yielded_as_error_and_reading_continues():
+    buffer = _zip({"a.png": b"a" * 200, "bad.png": b"b" * 200, "c.png": b"c" * 200})
+    raw = bytearray(buffer.getvalue())
+    with zipfile.ZipFile(io.BytesIO(bytes(raw))) as archive:
+        info = archive.getinfo("bad.png")
+    # Flip bytes inside the second member's compressed data (CRC mismatch or bad deflate data)
+    start = info.header_offset + 30 + len(info.filename) + len(info.extra)
+    for offset in range(start, start + info.compress_size):
+        raw[offset] ^= 0xFF
+
+    items = list(iter_archive(io.BytesIO(bytes(raw)), MAX_SIZE))
+
+    assert [name for name, _ in items] == ["a.png", "bad.png", "c.png"]
+    assert items[0][1] == b"a" * 200
+    assert isinstance(items[1][1], ArchiveError)
+    assert items[2][1] == b"c" * 200
+
+
+def test_zip_oversized_member_is_reported():
+    items = list(iter_archive(_zip({"big.png": b"x" * (MAX_SIZE + 1), "ok.png": b"ok"}), MAX_SIZE))
+    assert isinstance(items[0][1], ArchiveMemberTooLarge)
+    assert items[1] == ("ok.png", b"ok")
+
+
+def test_truncated_tar_ends_with_an_error_item():
+    data = _tar({"a.png": b"a" * 600, "b.png": b"b" * 600})
+    # Header + two 512-byte blocks for a.png, then b.png's header and part of its data
+    truncated = data[:512 + 1024 + 512 + 100]
+
+    items = list(iter_archive(io.BytesIO(truncated), MAX_SIZE))
+
+    assert items[0] == ("a.png", b"a" * 600)
+    assert len(items) == 2
+    assert isinstance(items[1][1], ArchiveError)
+
+
+def test_truncated_compressed_tar_ends_with_an_error_item():
+    data = _tar({f"{i}.png": bytes([i]) * 600 for i in range(20)}, mode="w:gz")
+
+    items = list(iter_archive(io.BytesIO(data[:len(data) // 2]), MAX_SIZE))
+
+    assert items, "the readable members come first"
+    assert all(isinstance(value, bytes) for _, value in items[:-1])
+    assert isinstance(items[-1][1], ArchiveError)
+
+
+def test_not_an_archive_raises():
+    with pytest.raises(ArchiveError):
+        list(iter_archive(io.BytesIO(b"not an archive at all" * 50), MAX_SIZE))
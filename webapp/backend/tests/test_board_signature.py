@@ -0,0 +1,67 @@
+"""BoardSignatureIndex: re-encoded copies of a board match, a board with one piece moved does not."""
+
+import cv2
+import numpy as np
+
+from cache import BoardSignatureIndex, board_signature
+
+SQUARE = 40
+THRESHOLD = 3.0  # BOARD_CACHE_THRESHOLD default
+
+
+def _board(pieces: dict[tuple[int, int], int]) -> np.ndarray:
+    """RGB board crop with a small disc per (rank, file) -> grey level."""
+    parity = np.indices((8, 8)).sum(axis=0) % 2
+    board = np.where(parity[..., None] == 0, (238, 238, 210), (118, 150, 86)).astype(np.uint8)
+    board = board.repeat(SQUARE, axis=0).repeat(SQUARE, axis=1)
+    for (rank, file), grey in pieces.items():
+        center = (file * SQUARE + SQUARE // 2, rank * SQUARE + SQUARE // 2)
+        cv2.circle(board, center, 7, (grey, grey, grey), thickness=-1)
+    return board
+
+
+def _jpeg(image: np.ndarray, quality: int = 85) -> np.ndarray:
+    _, buf = cv2.imencode(".jpg", cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return cv2.cvtColor(cv2.imdecode(buf, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+
+
+POSITION = {(0, 4): 20, (7, 4): 240, (1, 3): 20, (6, 4): 240, (3, 3): 60}
+PREDICTIONS = np.eye(13, dtype=np.float32)[np.zeros(64, dtype=int)]
+
+
+def _index_with(board: np.ndarray) -> BoardSignatureIndex:
+    index = BoardSignatureIndex(16, THRESHOLD)
+    index.add(board_signature(board), PREDICTIONS)
+    return index
+
+
+def test_reencoded_and_rescaled_board_matches():
+    board = _board(POSITION)
+    index = _index_with(board)
+
+    assert index.lookup(board_signature(_jpeg(board))) is PREDICTIONS
+    rescaled = cv2.resize(board, (300, 300), interpolation=cv2.INTER_AREA)
+    assert index.lookup(board_signature(rescaled)) is PREDICTIONS
+
+
+def test_one_moved_piece_is_not_a_hit():
+    index = _index_with(_board(POSITION))
+
+    # A dark disc on a dark square moved one square: the least contrast of any move here
+    moved = dict(POSITION)
+    del moved[(3, 3)]
+    moved[(3, 4)] = 60
+    # Averaged over the whole board the change is far below the threshold; per square it is not
+    difference = np.abs(board_signature(_board(POSITION)).astype(int) - board_signature(_board(moved)).astype(int))
+    assert difference.mean() < THRESHOLD
+    assert index.lookup(board_signature(_board(moved))) is None
+    assert index.lookup(board_signature(_jpeg(_board(moved)))) is None
+    assert index.stats()['hits'] == 0
+
+
+def test_one_captured_piece_is_not_a_hit():
+    index = _index_with(_board(POSITION))
+
+    captured = dict(POSITION)
+    del captured[(1, 3)]
+    assert index.lookup(board_signature(_board(captured))) is None
@@ -0,0 +1,39 @@
+"""JobSpool: a job that keeps crashing its worker is failed after max_attempts claims."""
+
+import io
+
+from jobs import JobSpool
+
+
+def _spool(tmp_path, max_attempts: int = 2) -> JobSpool:
+    return JobSpool(tmp_path, max_bytes=10 * 1024 * 1024, ttl_seconds=3600, max_attempts=max_attempts)
+
+
+def test_job_without_progress_fails_after_max_attempts(tmp_path):
+    spool = _spool(tmp_path)
+    job_id = spool.create([("a.png", io.BytesIO(b"png"))], {})
+
+    for attempt in (1, 2):
+        claim = spool.claim_next()
+        assert claim is not None and claim.job_id == job_id
+        assert claim.state()['attempts'] == attempt
+        claim.release()  # the worker died without writing a result
+
+    assert spool.claim_next() is None
+    state = spool.state(job_id)
+    assert state['status'] == 'failed'
+    assert "2 attempts" in state['error']
+
+
+def test_progress_resets_the_attempt_count(tmp_path):
+    spool = _spool(tmp_path)
+    job_id = spool.create([("a.png", io.BytesIO(b"png")), ("b.png", io.BytesIO(b"png"))], {})
+
+    for index in range(3):
+        claim = spool.claim_next()
+        assert claim is not None and claim.job_id == job_id
+        assert claim.state()['attempts'] == 1
+        claim.append({'index': index})  # restarted after storing a result
+        claim.release()
+
+    assert spool.state(job_id)['status'] != 'failed'
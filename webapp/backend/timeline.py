@@ -0,0 +1,201 @@
+"""
+Video to FEN Timeline
+
+Extracts the sequence of positions from a broadcast VOD (or a directory of
+frames) as deduplicated (timestamp, FEN) records:
+1. Sample frames at a fixed rate (skipped frames are grabbed, not decoded to RGB)
+2. Detect the board once, and again only when the layout changes (frame size
+   changes, or most squares change at once)
+3. Skip frames whose board region matches the last processed one
+4. Batch the remaining boards through the model
+5. Drop records whose FEN equals the previous record's
+
+Usage:
+    python timeline.py game.mp4 [--sample-fps 2] [--out timeline.jsonl]
+    python timeline.py frames_dir/ --fps 30
+"""
+
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import Iterator
+
+import cv2
+import numpy as np
+
+from board_detection import detect_board
+from fen_generator import InferenceRunner, batch_buckets, load_model, predictions_to_fen, process_board_for_model
+from live import changed_tiles, tile_thumbnails
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = {'.png', '.jpg', '.jpeg', '.webp', '.bmp'}
+
+
+def iter_frames(source: str | Path, sample_fps: float, sequence_fps: float = 1.0) -> Iterator[tuple[float, np.ndarray]]:
+    """Yield (timestamp_seconds, RGB frame) sampled from a video file or an image directory.
+
+    Args:
+        source: Video file, or directory of frames (sorted by filename)
+        sample_fps: Frames per second to sample
+        sequence_fps: Frame rate of an image directory, used for its timestamps
+    """
+    source = Path(source)
+    if source.is_dir():
+        paths = sorted(p for p in source.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        step = max(1, round(sequence_fps / sample_fps))
+        for i in range(0, len(paths), step):
+            frame = cv2.imread(str(paths[i]), cv2.IMREAD_COLOR)
+            if frame is not None:
+                yield i / sequence_fps, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+        return
+
+    capture = cv2.VideoCapture(str(source))
+    if not capture.isOpened():
+        raise FileNotFoundError(f"Cannot open video: {source}")
+    video_fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    step = max(1, round(video_fps / sample_fps))
+    index = 0
+    try:
+        while True:
+            # grab() advances without converting the frame; only sampled frames are retrieved
+            if not capture.grab():
+                break
+            if index % step == 0:
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                yield index / video_fps, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+            index += 1
+    finally:
+        capture.release()
+
+
+class TimelineExtractor:
+    """Turn a stream of frames into deduplicated (timestamp, FEN) records.
+
+    Args:
+        model: Loaded model or InferenceRunner (anything with a Keras-style predict())
+        batch_size: Boards per model call
+        diff_threshold: Mean grey-level difference for a square to count as changed
+            (frames with no changed square are skipped)
+        layout_change_tiles: More changed squares than this triggers board re-detection
+        active_color: Side to move written into the standard FEN
+    """
+
+    def __init__(self, model, batch_size: int = 32, diff_threshold: float = 2.0,
+                 layout_change_tiles: int = 24, active_color: str = 'w'):
+        self.model = model
+        self.batch_size = batch_size
+        self.diff_threshold = diff_threshold
+        self.layout_change_tiles = layout_change_tiles
+        self.active_color = active_color
+        self.frame_shape = None
+        self.bbox = None
+        self.thumbnails = None
+        self.records: list[dict] = []
+        self._pending: list[tuple[float, np.ndarray]] = []
+        self.stats = {'frames': 0, 'skipped': 0, 'detections': 0, 'no_board': 0, 'classified': 0}
+
+    def _detect(self, frame: np.ndarray):
+        self.stats['detections'] += 1
+        cropped, bbox, success = detect_board(frame)
+        if not success:
+            self.bbox = None
+            return None
+        self.frame_shape = frame.shape
+        self.bbox = bbox
+        return cropped
+
+    def add_frame(self, timestamp: float, frame: np.ndarray) -> None:
+        """Process one sampled frame."""
+        self.stats['frames'] += 1
+        if self.bbox is not None and frame.shape == self.frame_shape:
+            y0, y1, x0, x1 = self.bbox
+            cropped = frame[y0:y1, x0:x1]
+            thumbnails = tile_thumbnails(cropped)
+            n_changed = int(changed_tiles(self.thumbnails, thumbnails, self.diff_threshold).sum())
+            if n_changed == 0:
+                self.stats['skipped'] += 1
+                return
+            if n_changed > self.layout_change_tiles:
+                cropped = self._detect(frame)
+        else:
+            cropped = self._detect(frame)
+
+        if cropped is None:
+            self.stats['no_board'] += 1
+            return
+        self.thumbnails = tile_thumbnails(cropped)
+        self._pending.append((timestamp, process_board_for_model(cropped)))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Classify the queued boards and append records for new positions."""
+        if not self._pending:
+            return
+        batch = np.concatenate([tiles for _, tiles in self._pending])
+        predictions = self.model.predict(batch, verbose=0)
+        for i, (timestamp, _) in enumerate(self._pending):
+            result = predictions_to_fen(predictions[i * 64:(i + 1) * 64], active_color=self.active_color)
+            self.stats['classified'] += 1
+            if self.records and self.records[-1]['fen'] == result['fen']:
+                continue
+            self.records.append({
+                'timestamp': round(timestamp, 3),
+                'fen': result['fen'],
+                'fen_standard': result['fen_standard'],
+                'confidence': result['avg_confidence'],
+            })
+        self._pending = []
+
+
+def extract_timeline(model, source: str | Path, sample_fps: float = 2.0, sequence_fps: float = 1.0,
+                     **kwargs) -> tuple[list[dict], dict]:
+    """Extract deduplicated (timestamp, FEN) records from a video or frame directory.
+
+    Returns:
+        (records, stats) where stats counts sampled, skipped and classified frames
+    """
+    extractor = TimelineExtractor(model, **kwargs)
+    for timestamp, frame in iter_frames(source, sample_fps, sequence_fps):
+        extractor.add_frame(timestamp, frame)
+    extractor.flush()
+    return extractor.records, extractor.stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Video file or directory of frames")
+    parser.add_argument("--sample-fps", type=float, default=2.0, help="Frames per second to analyse")
+    parser.add_argument("--fps", type=float, default=1.0, help="Frame rate of an image directory")
+    parser.add_argument("--batch-size", type=int, default=32, help="Boards per model call")
+    parser.add_argument("--diff-threshold", type=float, default=2.0,
+                        help="Mean grey-level change for a square to count as changed")
+    parser.add_argument("--active-color", choices=['w', 'b'], default='w')
+    parser.add_argument("--out", type=Path, help="Write JSON lines here instead of stdout")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    model = InferenceRunner(load_model(), batch_buckets(args.batch_size))
+    records, stats = extract_timeline(
+        model, args.source, sample_fps=args.sample_fps, sequence_fps=args.fps,
+        batch_size=args.batch_size, diff_threshold=args.diff_threshold, active_color=args.active_color,
+    )
+    logger.info("Frames: %(frames)d sampled, %(skipped)d unchanged, %(classified)d classified, "
+                "%(detections)d detections, %(no_board)d without a board", stats)
+
+    out = args.out.open("w") if args.out else sys.stdout
+    try:
+        for record in records:
+            out.write(json.dumps(record) + "\n")
+    finally:
+        if args.out:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Upload Size Limits
+
+Request bodies are checked while they are being received rather than after
+they have been buffered:
+- BodySizeLimitMiddleware rejects a request whose Content-Length is over the
+  limit before reading it, and aborts one whose streamed body grows past it
+- read_upload_limited() reads an UploadFile in chunks up to the limit
+"""
+
+from fastapi import HTTPException, UploadFile
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class BodyTooLarge(HTTPException):
+    """413 raised as soon as a request body exceeds its size limit."""
+
+    def __init__(self, limit: int):
+        super().__init__(
+            status_code=413,
+            detail=f"Request too large. Maximum size is {limit // (1024 * 1024)} MB.",
+        )
+
+
+class BodySizeLimitMiddleware:
+    """ASGI middleware enforcing a per-path request body size limit while receiving.
+
+    Raising BodyTooLarge (an HTTPException) from receive() lets FastAPI's
+    normal HTTPException handling turn it into a 413 response, whether the
+    body is being parsed as multipart or read as a raw stream.
+
+    Args:
+        app: ASGI app to wrap
+        max_body_size: Default limit in bytes
+        path_limits: Optional {path prefix: limit} overrides; longest match wins
+    """
+
+    def __init__(self, app, max_body_size: int, path_limits: dict[str, int] | None = None):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.path_limits = sorted((path_limits or {}).items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _limit_for(self, path: str) -> int:
+        for prefix, limit in self.path_limits:
+            if path.startswith(prefix):
+                return limit
+        return self.max_body_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self._limit_for(scope["path"])
+        for name, value in scope.get("headers", []):
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                await self._reject(send, limit)
+                return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise BodyTooLarge(limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    async def _reject(send, limit: int) -> None:
+        error = BodyTooLarge(limit)
+        body = ('{"detail":"%s"}' % error.detail).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode()),
+                        (b"connection", b"close")],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+async def read_upload_limited(upload: UploadFile, limit: int) -> bytes:
+    """Read an uploaded file in chunks, raising 413 once it exceeds limit bytes."""
+    chunks = []
+    received = 0
+    while True:
+        chunk = await upload.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        received += len(chunk)
+        if received > limit:
+            raise HTTPException(status_code=413, detail="File too large. Maximum size is 10 MB.")
+        chunks.append(chunk)
+    return b"".join(chunks)
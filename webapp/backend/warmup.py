@@ -0,0 +1,57 @@
+"""
+Startup Warmup
+
+The first model call after loading is much slower than the rest: TensorFlow
+traces the predict graph and allocates its buffers lazily, and OpenCV /
+scikit-image initialise on first use. Warmup pays those costs at startup by
+running a synthetic screenshot through detection and preprocessing, then
+calling the model at every input size it is compiled for, so the first real
+request is served at steady-state speed.
+"""
+
+import logging
+import time
+from typing import Callable, Iterable
+
+import numpy as np
+
+from board_detection import detect_board
+from fen_generator import process_board_for_model
+
+logger = logging.getLogger(__name__)
+
+
+def synthetic_screenshot(square: int = 40, margin: int = 60) -> np.ndarray:
+    """RGB image of an empty 8x8 board on a flat background, as a screenshot would show it."""
+    board = np.indices((8, 8)).sum(axis=0) % 2
+    board = np.where(board[..., None] == 0, (238, 238, 210), (118, 150, 86)).astype(np.uint8)
+    board = board.repeat(square, axis=0).repeat(square, axis=1)
+    image = np.full((board.shape[0] + 2 * margin, board.shape[1] + 2 * margin, 3), 40, dtype=np.uint8)
+    image[margin:margin + board.shape[0], margin:margin + board.shape[1]] = board
+    return image
+
+
+def warmup(predict_fn: Callable[[np.ndarray], np.ndarray], tile_counts: Iterable[int]) -> float:
+    """Run the pipeline once on a synthetic board and the model once per input size.
+
+    Args:
+        predict_fn: Callable taking an (N, 40, 40, 3) array, as passed to the micro-batcher
+        tile_counts: Model input sizes (rows) to warm up
+
+    Returns:
+        Seconds spent
+    """
+    start = time.perf_counter()
+    cropped, _, success = detect_board(synthetic_screenshot())
+    tiles = process_board_for_model(cropped)
+    if not success:
+        logger.warning("Warmup: board not detected in the synthetic screenshot")
+
+    for count in sorted(set(tile_counts)):
+        repeats = -(-count // len(tiles))
+        batch = np.concatenate([tiles] * repeats)[:count]
+        call_start = time.perf_counter()
+        predict_fn(batch)
+        logger.info("Warmup: %d tiles in %.2f s", count, time.perf_counter() - call_start)
+    return time.perf_counter() - start
+
@@ -0,0 +1,119 @@
+"""
+Bounded CPU Executor
+
+Board detection, tile preprocessing and image encoding are CPU-bound and
+would stall the asyncio event loop if run inline. This module runs them on a
+dedicated thread pool (OpenCV, NumPy and TensorFlow release the GIL for the
+heavy parts) and caps how much work may be waiting for a thread, so that an
+overloaded server rejects new work quickly instead of letting latency grow
+without bound.
+
+Several executors can run side by side as priority lanes: a low-priority
+lane gets its own threads and backlog, and its threads can be given a
+higher nice value so the OS scheduler favours the interactive lane's threads
+when both compete for the CPU.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorBusy(Exception):
+    """Raised when the executor already holds as much work as it may queue."""
+
+    def __init__(self, name: str, retry_after: int = 1):
+        super().__init__(f"{name} executor is at capacity")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """Thread pool with a fixed number of workers and a bounded backlog.
+
+    Args:
+        name: Name used for thread names and error messages
+        max_workers: Number of worker threads
+        queue_depth: Number of tasks allowed to wait for a free worker
+        retry_after: Seconds suggested to clients when the executor is full
+        on_change: Optional callback(in_flight, queued) invoked whenever the load changes
+        nice: Niceness added to each worker thread (Linux; 0 leaves the priority alone)
+    """
+
+    def __init__(self, name: str, max_workers: int, queue_depth: int, retry_after: int = 1,
+                 on_change: Callable[[int, int], None] | None = None, nice: int = 0):
+        self.name = name
+        self.on_change = on_change
+        self.max_workers = max(1, max_workers)
+        self.queue_depth = max(0, queue_depth)
+        self.retry_after = retry_after
+        self.nice = nice
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name,
+                                        initializer=self._init_thread)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def _init_thread(self) -> None:
+        if self.nice <= 0:
+            return
+        # On Linux, PRIO_PROCESS with a thread id sets that thread's niceness only
+        try:
+            tid = threading.get_native_id()
+            os.setpriority(os.PRIO_PROCESS, tid, os.getpriority(os.PRIO_PROCESS, tid) + self.nice)
+        except (AttributeError, OSError) as e:
+            logger.warning("Could not lower the priority of %s threads: %s", self.name, e)
+
+    @property
+    def capacity(self) -> int:
+        """Maximum number of running plus queued tasks."""
+        return self.max_workers + self.queue_depth
+
+    @property
+    def in_flight(self) -> int:
+        """Number of tasks currently running or waiting for a worker."""
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        """Number of tasks waiting for a free worker."""
+        return max(0, self._in_flight - self.max_workers)
+
+    def _notify(self) -> None:
+        if self.on_change is not None:
+            self.on_change(self._in_flight, self.queued)
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._notify()
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the pool and await its result.
+
+        Raises:
+            ExecutorBusy: If running and queued tasks already fill the capacity
+        """
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                raise ExecutorBusy(self.name, self.retry_after)
+            self._in_flight += 1
+            self._notify()
+        try:
+            future = self._pool.submit(functools.partial(fn, *args, **kwargs))
+        except Exception:
+            self._release(None)
+            raise
+        # Release on completion of the thread task itself, so a cancelled
+        # request does not free its slot while its work is still running
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self) -> None:
+        """Stop accepting work and wait for running tasks to finish."""
+        self._pool.shutdown(wait=True)